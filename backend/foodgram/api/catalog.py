@@ -0,0 +1,121 @@
+import re
+from bisect import bisect_left
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+from recipes.catalog import get_catalog_version
+from recipes.models import Ingredient
+
+WORD_SEPARATOR = re.compile(r'[\W_]+')
+
+
+def normalize(text):
+    return text.casefold().replace('ё', 'е')
+
+
+class IngredientIndex:
+
+    def __init__(self, ingredients):
+        self.ingredients = sorted(
+            ingredients, key=lambda item: normalize(item['name'])
+        )
+        self.names = [normalize(item['name']) for item in self.ingredients]
+        words = sorted(
+            (word, position)
+            for position, name in enumerate(self.names)
+            for word in WORD_SEPARATOR.split(name)[1:] if word
+        )
+        self.words = [word for word, _ in words]
+        self.word_positions = [position for _, position in words]
+
+    @staticmethod
+    def prefix_range(keys, prefix):
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + '\uffff', lo=start)
+        return start, end
+
+    def search(self, query, limit=None):
+        prefix = normalize(query.strip())
+        if not prefix:
+            return self.ingredients[:limit]
+        start, end = self.prefix_range(self.names, prefix)
+        if limit is not None and end - start >= limit:
+            return self.ingredients[start:start + limit]
+        matches = range(start, end)
+        start, end = self.prefix_range(self.words, prefix)
+        word_matches = sorted({
+            position for position in self.word_positions[start:end]
+            if position not in matches
+        })
+        return [
+            self.ingredients[position]
+            for position in (*matches, *word_matches)
+        ][:limit]
+
+
+_index = None
+_index_version = None
+_index_lock = Lock()
+
+
+def get_ingredient_index():
+    global _index, _index_version
+    version = get_catalog_version()
+    if _index_version != version:
+        with _index_lock:
+            if _index_version != version:
+                _index = IngredientIndex(
+                    Ingredient.objects.values(
+                        'id', 'name', 'measurement_unit'
+                    )
+                )
+                _index_version = version
+    return _index
+
+
+class CatalogListMixin:
+    catalog_name = None
+    _bodies = {}
+
+    def get_catalog_body(self, version):
+        key = (self.catalog_name, version)
+        body = self._bodies.get(key)
+        if body is None:
+            cache_key = f'catalog:{self.catalog_name}:{version}'
+            body = cache.get(cache_key)
+            if body is None:
+                body = JSONRenderer().render(self.get_serializer(
+                    self.get_queryset(), many=True
+                ).data)
+                cache.set(cache_key, body, timeout=None)
+            for stale in [
+                stale for stale in self._bodies if stale[0] == key[0]
+            ]:
+                del self._bodies[stale]
+            self._bodies[key] = body
+        return body
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params:
+            return super().list(request, *args, **kwargs)
+        version = get_catalog_version()
+        etag = f'"{self.catalog_name}-{version}"'
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(
+                self.get_catalog_body(version),
+                content_type='application/json',
+            )
+        response['ETag'] = etag
+        patch_cache_control(
+            response, public=True, max_age=settings.CATALOG_MAX_AGE
+        )
+        return response
@@ -0,0 +1,74 @@
+import hashlib
+
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date
+
+from recipes.catalog import get_catalog_version
+from recipes.versions import (
+    GLOBAL,
+    author_scope,
+    get_changed_at,
+    get_versions,
+)
+
+
+def get_recipes_validators(recipes, *extra, listing=False):
+    recipes = list(recipes)
+    # Данные автора встроены в рецепт, но не сдвигают его updated_at.
+    authors = [
+        author_scope(author_id)
+        for author_id in sorted({recipe.author_id for recipe in recipes})
+    ]
+    digest = hashlib.md5(repr((
+        get_catalog_version(),
+        get_versions(authors),
+        extra,
+        [
+            (
+                recipe.id,
+                recipe.updated_at.timestamp(),
+                recipe.is_favorited,
+                recipe.is_in_shopping_cart,
+            )
+            for recipe in recipes
+        ],
+    )).encode())
+    # Удалённый рецепт пропадает со страницы, не оставляя updated_at,
+    # поэтому список датируем последним сбросом общей области.
+    last_modified = get_changed_at((GLOBAL,)) if listing else max(
+        get_changed_at(authors),
+        *(int(recipe.updated_at.timestamp()) for recipe in recipes),
+    )
+    return f'"{digest.hexdigest()}"', last_modified
+
+
+def get_not_modified_response(request, etag, last_modified):
+    # Для авторизованных ответ зависит от избранного и корзины,
+    # которые не отражены в Last-Modified, поэтому сверяем только ETag.
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=(
+            last_modified if request.user.is_anonymous else None
+        ),
+    )
+    if response is not None:
+        set_validators(request, response, etag, last_modified)
+    return response
+
+
+def set_validators(request, response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # patch_cache_control выводит False как «private=False».
+    if request.user.is_authenticated:
+        patch_cache_control(response, no_cache=True, private=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    patch_vary_headers(response, ('Authorization',))
+    return response
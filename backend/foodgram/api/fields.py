@@ -0,0 +1,98 @@
+import uuid
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from drf_extra_fields.fields import Base64FieldMixin, Base64ImageField
+from PIL import Image
+from rest_framework import serializers
+
+from recipes.images import VARIANTS
+from recipes.models import ImageUpload
+from recipes.storage import image_storage
+
+
+class ImageHeaderField(forms.ImageField):
+    """Проверяет только заголовок: полное декодирование делает воркер."""
+
+    def to_python(self, data):
+        file = forms.FileField.to_python(self, data)
+        if file is None:
+            return None
+        try:
+            with Image.open(file) as image:
+                file.image = image
+                file.content_type = Image.MIME.get(image.format)
+        except Exception as error:
+            raise ValidationError(
+                self.error_messages['invalid_image'],
+                code='invalid_image',
+            ) from error
+        if hasattr(file, 'seek') and callable(file.seek):
+            file.seek(0)
+        return file
+
+
+class RecipeImageField(Base64ImageField):
+    """Принимает base64, загруженный файл или id завершённой загрузки."""
+
+    default_error_messages = {
+        'upload_not_found': 'Загрузка не найдена',
+        'upload_incomplete': 'Загрузка ещё не завершена',
+    }
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('_DjangoImageField', ImageHeaderField)
+        super().__init__(*args, **kwargs)
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            return self.validate_file(data)
+        try:
+            upload_id = uuid.UUID(data)
+        except ValueError:
+            return super().to_internal_value(data)
+        return self.get_upload_file(upload_id)
+
+    def validate_file(self, data):
+        file = super(Base64FieldMixin, self).to_internal_value(data)
+        extension = file.image.format.lower()
+        if extension not in self.ALLOWED_TYPES:
+            raise ValidationError(self.INVALID_TYPE_MESSAGE)
+        file.name = f'{uuid.uuid4()}.{extension}'
+        return file
+
+    def get_upload_file(self, upload_id):
+        upload = ImageUpload.objects.filter(
+            id=upload_id, user=self.context['request'].user
+        ).first()
+        if upload is None:
+            self.fail('upload_not_found')
+        if not upload.is_complete:
+            self.fail('upload_incomplete')
+        try:
+            with Image.open(upload.path) as image:
+                extension = image.format.lower()
+        except Exception as error:
+            raise ValidationError(self.INVALID_FILE_MESSAGE) from error
+        file = self.validate_file(File(
+            open(upload.path, 'rb'), name=f'{upload.id.hex}.{extension}'
+        ))
+        file.upload = upload
+        return file
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+
+    def to_representation(self, variants):
+        request = self.context.get('request')
+        return {
+            variant: {
+                extension: request.build_absolute_uri(
+                    image_storage.url(name)
+                ) if request else image_storage.url(name)
+                for extension, name in variants[variant].items()
+            }
+            for variant in VARIANTS
+            if variant in variants
+        }
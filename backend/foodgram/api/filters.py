@@ -1,11 +1,28 @@
+from django.db import connection
+from django.db.models import (
+    BooleanField,
+    Case,
+    Exists,
+    FloatField,
+    OuterRef,
+    Q,
+    Value,
+    When,
+)
+from django.db.models.expressions import RawSQL
 from django_filters.rest_framework import BooleanFilter, CharFilter, FilterSet
-from rest_framework.filters import SearchFilter
 
 from recipes.models import Recipe
 
-
-class IngredientSearchFilter(SearchFilter):
-    search_param = 'name'
+SEARCH_MATCH_SQL = (
+    "recipes_recipe.search_vector @@ websearch_to_tsquery('russian', %s) "
+    "OR recipes_recipe.name %% %s"
+)
+SEARCH_RANK_SQL = (
+    "ts_rank(recipes_recipe.search_vector, "
+    "websearch_to_tsquery('russian', %s)) "
+    "+ similarity(recipes_recipe.name, %s)"
+)
 
 
 class RecipeFilter(FilterSet):
@@ -19,26 +36,52 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = CharFilter(
+        method='filter_search'
+    )
 
     class Meta:
         model = Recipe
-        fields = ('is_favorited', 'is_in_shopping_cart', 'author', 'tags')
+        fields = (
+            'is_favorited',
+            'is_in_shopping_cart',
+            'author',
+            'tags',
+            'search',
+        )
 
     def filter_tags(self, recipes, slug, tags):
-        return recipes.filter(
-            tags__slug__in=self.request.GET.getlist('tags')
-        ).distinct()
+        return recipes.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'),
+            tag__slug__in=self.request.GET.getlist('tags'),
+        )))
 
     def filter_is_favorited(self, recipes, name, value):
         if value and self.request.user.is_authenticated:
-            return recipes.filter(
-                favorites__user=self.request.user
-            )
+            return recipes.filter(is_favorited=True)
         return recipes
 
     def filter_is_in_shopping_cart(self, recipes, name, value):
         if value and self.request.user.is_authenticated:
-            return recipes.filter(
-                shoppingcarts__user=self.request.user
-            )
+            return recipes.filter(is_in_shopping_cart=True)
         return recipes
+
+    def filter_search(self, recipes, name, value):
+        value = value.strip()
+        if not value:
+            return recipes
+        if connection.vendor == 'postgresql':
+            return recipes.filter(
+                RawSQL(SEARCH_MATCH_SQL, (value, value), BooleanField())
+            ).annotate(
+                search_rank=RawSQL(
+                    SEARCH_RANK_SQL, (value, value), FloatField()
+                )
+            ).order_by('-search_rank', '-pub_date')
+        return recipes.filter(
+            Q(name__icontains=value) | Q(text__icontains=value)
+        ).annotate(search_rank=Case(
+            When(name__icontains=value, then=Value(1.0)),
+            default=Value(0.5),
+            output_field=FloatField(),
+        )).order_by('-search_rank', '-pub_date')
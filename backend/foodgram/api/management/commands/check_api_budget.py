@@ -0,0 +1,208 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag, User
+
+SERVER_NAME = 'localhost'
+
+ENDPOINTS = (
+    ('recipes-list', '/api/recipes/?limit=6', False),
+    ('recipes-list-large', '/api/recipes/?limit=50', False),
+    ('recipes-list-tags', '/api/recipes/?tags={tag}&tags={other_tag}', False),
+    ('recipes-list-author', '/api/recipes/?author={author}', False),
+    ('recipes-list-favorited', '/api/recipes/?is_favorited=1', True),
+    ('recipes-list-in-cart', '/api/recipes/?is_in_shopping_cart=1', True),
+    ('recipes-popular', '/api/recipes/popular/', False),
+    ('recipes-detail', '/api/recipes/{recipe}/', False),
+    ('download-shopping-cart', '/api/recipes/download_shopping_cart/', True),
+    ('users-list', '/api/users/', False),
+    ('users-detail', '/api/users/{author}/', False),
+    ('users-me', '/api/users/me/', True),
+    ('subscriptions', '/api/users/subscriptions/?recipes_limit=3', True),
+    ('ingredients-list', '/api/ingredients/', False),
+    ('ingredients-search', '/api/ingredients/?name={prefix}', False),
+    ('ingredients-detail', '/api/ingredients/{ingredient}/', False),
+    ('tags-list', '/api/tags/', False),
+    ('tags-detail', '/api/tags/{tag_id}/', False),
+)
+
+
+class Command(BaseCommand):
+    help = ('Measure SQL queries and p95 latency of every API endpoint '
+            'and compare them with the stored baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', action='store_true',
+            help='Seed a synthetic dataset and roll it back afterwards',
+        )
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--time-tolerance', type=float, default=1.5,
+            help='Allowed p95 growth factor over the baseline, relative '
+                 'to the median growth of all endpoints in the run',
+        )
+        parser.add_argument(
+            '--time-slack', type=float, default=10,
+            help='p95 growth in milliseconds that is always tolerated',
+        )
+        parser.add_argument(
+            '--baseline', default=settings.API_BUDGET_FILE,
+        )
+        parser.add_argument(
+            '--update', action='store_true',
+            help='Overwrite the baseline with the measured values',
+        )
+        parser.add_argument(
+            '--strict-time', action='store_true',
+            help='Fail on p95 regressions instead of only reporting them',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['seed']:
+                self.seed(options)
+            # Запросы шлёт тестовый клиент, ALLOWED_HOSTS окружения
+            # к нему не относятся. Кеш ответов отключаем: повторные
+            # запросы из него скрыли бы лишние запросы к базе.
+            with override_settings(
+                ALLOWED_HOSTS=[SERVER_NAME], RECIPES_CACHE_TIMEOUT=0
+            ):
+                results = self.measure(options['repeat'])
+            transaction.set_rollback(True)
+
+        if options['update']:
+            with open(options['baseline'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=4, sort_keys=True)
+                file.write('\n')
+            self.stdout.write(self.style.SUCCESS('Базовые значения обновлены'))
+            return
+
+        with open(options['baseline'], 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+
+        regressions, slowdowns = [], []
+        # Скорость машины CI меняется от запуска к запуску, поэтому время
+        # сравниваем с медианным замедлением всех эндпоинтов этого запуска.
+        ratios = [
+            measured['p95_ms'] / baseline[name]['p95_ms']
+            for name, measured in results.items()
+            if baseline.get(name, {}).get('p95_ms')
+        ]
+        scale = statistics.median(ratios) if ratios else 1
+        for name, measured in results.items():
+            expected = baseline.get(name)
+            self.stdout.write(
+                f'{name}: {measured["queries"]} запросов, '
+                f'p95 {measured["p95_ms"]} мс'
+            )
+            if expected is None:
+                regressions.append(f'{name}: нет базового значения')
+                continue
+            if measured['queries'] > expected['queries']:
+                regressions.append(
+                    f'{name}: {measured["queries"]} запросов '
+                    f'вместо {expected["queries"]}'
+                )
+            if measured['p95_ms'] > max(
+                expected['p95_ms'] * scale * options['time_tolerance'],
+                expected['p95_ms'] * scale + options['time_slack'],
+            ):
+                slowdowns.append(
+                    f'{name}: p95 {measured["p95_ms"]} мс вместо '
+                    f'{expected["p95_ms"]} мс (медианное замедление '
+                    f'{scale:.2f})'
+                )
+        if options['strict_time']:
+            regressions.extend(slowdowns)
+        elif slowdowns:
+            self.stdout.write(self.style.WARNING('\n'.join(slowdowns)))
+        if regressions:
+            raise CommandError('\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Бюджет запросов соблюдён'))
+
+    def measure(self, repeat):
+        user = User.objects.filter(followers__isnull=False).first()
+        recipe = Recipe.objects.first()
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        ingredient = Ingredient.objects.first()
+        if not (user and recipe and ingredient and len(tags) == 2):
+            raise CommandError(
+                'База данных пуста, запустите команду с флагом --seed'
+            )
+        params = {
+            'recipe': recipe.id,
+            'author': recipe.author_id,
+            'tag': tags[0],
+            'other_tag': tags[1],
+            'tag_id': Tag.objects.get(slug=tags[0]).id,
+            'ingredient': ingredient.id,
+            'prefix': ingredient.name[:2],
+        }
+        anonymous = APIClient(SERVER_NAME=SERVER_NAME)
+        authenticated = APIClient(SERVER_NAME=SERVER_NAME)
+        authenticated.force_authenticate(user)
+
+        results = {}
+        for name, url, auth_only in ENDPOINTS:
+            url = url.format(**params)
+            clients = (('auth', authenticated),)
+            if not auth_only:
+                clients = (('anon', anonymous), *clients)
+            for role, client in clients:
+                results[f'{name}:{role}'] = self.measure_endpoint(
+                    client, url, repeat
+                )
+        return results
+
+    def measure_endpoint(self, client, url, repeat):
+        # Первый запрос заполняет кеши версий и счётчиков, в замеры
+        # он не входит.
+        response = client.get(url)
+        if getattr(response, 'streaming', False):
+            b''.join(response.streaming_content)
+        timings, queries_count = [], 0
+        for _ in range(repeat):
+            reset_queries()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.get(url)
+                if getattr(response, 'streaming', False):
+                    b''.join(response.streaming_content)
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(
+                    f'{url}: неожиданный статус {response.status_code}'
+                )
+            # Число запросов — жёсткая граница, берём худший из повторов.
+            queries_count = max(queries_count, len(queries))
+        return {
+            'queries': queries_count,
+            'p95_ms': round(
+                statistics.quantiles(
+                    timings, n=20, method='inclusive'
+                )[-1]
+                if len(timings) > 1 else timings[0],
+                2
+            ),
+        }
+
+    def seed(self, options):
+        call_command(
+            'generate_dataset',
+            users=options['users'],
+            recipes=options['recipes'],
+            ingredients_per_recipe=options['ingredients_per_recipe'],
+            stdout=self.stdout,
+        )
@@ -0,0 +1,312 @@
+import difflib
+import json
+import os
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import RequestFactory
+
+from api.filters import RecipeFilter
+from api.pagination import KeysetPagination, LimitPagination
+from api.views import POPULAR_ORDERING, RecipeViewSet
+from recipes.constants import DEFAULT_POPULAR_PERIOD
+from recipes.models import (
+    Favorite,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+    User,
+)
+
+RECIPE_FILTERS = (
+    ('recipes-list-tags', 'tags={tag}&tags={other_tag}'),
+    ('recipes-list-author', 'author={author}'),
+    ('recipes-list-favorited', 'is_favorited=1'),
+    ('recipes-list-in-cart', 'is_in_shopping_cart=1'),
+)
+
+# Страницы курсора должны начинаться с позиции в индексе, а не фильтровать
+# его с начала.
+KEYSET_QUERIES = {
+    'recipes-list-deep': ('recipe_pub_date_id_idx', 'pub_date'),
+    'recipes-popular-deep': ('popular_period_score_idx', 'score'),
+}
+
+
+def get_sql(queryset):
+    return queryset.query.sql_with_params()
+
+
+def get_count_sql(queryset):
+    sql, params = get_sql(queryset.order_by())
+    return f'SELECT COUNT(*) FROM ({sql}) subquery', params
+
+
+# Параллельное выполнение, Memoize и способ чтения индекса зависят от версии
+# PostgreSQL и карты видимости, а не от запроса: в форму плана не входят.
+TRANSPARENT_NODES = ('Gather', 'Gather Merge', 'Memoize')
+INDEX_SCANS = ('Index Scan', 'Index Only Scan', 'Bitmap Heap Scan')
+
+
+def get_shape(node, depth=0):
+    children = node.get('Plans', ())
+    if node['Node Type'] in TRANSPARENT_NODES or (
+        node.get('Partial Mode') == 'Partial'
+    ):
+        for child in children:
+            yield from get_shape(child, depth)
+        return
+    line, index = node['Node Type'], node.get('Index Name')
+    if line in INDEX_SCANS:
+        if line == 'Bitmap Heap Scan' and len(children) == 1 and (
+            children[0]['Node Type'] == 'Bitmap Index Scan'
+        ):
+            index, children = children[0]['Index Name'], ()
+        line = 'Index Scan'
+    if 'Relation Name' in node:
+        line += f' on {node["Relation Name"]}'
+    if index:
+        line += f' using {index}'
+    yield '  ' * depth + line
+    for child in children:
+        yield from get_shape(child, depth + 1)
+
+
+def walk(node):
+    yield node
+    for child in node.get('Plans', ()):
+        yield from walk(child)
+
+
+def get_deep_page(queryset, ordering, page_size):
+    paginator = KeysetPagination(ordering, page_size)
+    fields = [field for field, _ in paginator.ordering]
+    queryset = queryset.order_by(*ordering)
+    values = list(queryset.values_list(*fields)[queryset.count() // 2])
+    return get_sql(queryset.filter(
+        paginator.get_position_filter(values, False)
+    )[:page_size + 1])
+
+
+def get_rows(node):
+    return node.get('Actual Rows', 0) * node.get('Actual Loops', 1)
+
+
+class Command(BaseCommand):
+    help = ('Capture EXPLAIN ANALYZE plans of hot queries and compare '
+            'their shapes with the stored baseline (PostgreSQL only)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', action='store_true',
+            help='Seed a synthetic dataset and roll it back afterwards',
+        )
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=20)
+        parser.add_argument(
+            '--scan-rows', type=int, default=1000,
+            help='Flag sequential scans and sorts over this many rows',
+        )
+        parser.add_argument(
+            '--baseline', default=settings.QUERY_PLANS_FILE,
+        )
+        parser.add_argument(
+            '--update', action='store_true',
+            help='Overwrite the baseline with the captured plans',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Планы запросов снимаются только на PostgreSQL')
+        self.scan_rows = options['scan_rows']
+        with transaction.atomic():
+            if options['seed']:
+                self.seed(options)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            results = {
+                name: self.explain(sql, params)
+                for name, (sql, params) in self.get_queries().items()
+            }
+            transaction.set_rollback(True)
+
+        server_version = connection.pg_version // 10000
+        if options['update']:
+            with open(options['baseline'], 'w', encoding='utf-8') as file:
+                json.dump(
+                    {'server_version': server_version, 'plans': results},
+                    file, indent=4, sort_keys=True,
+                )
+                file.write('\n')
+            self.stdout.write(self.style.SUCCESS('Базовые планы обновлены'))
+            return
+
+        if not os.path.exists(options['baseline']):
+            raise CommandError(
+                'Нет базовых планов, запустите команду с флагом --update'
+            )
+        with open(options['baseline'], 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        # Форма плана зависит от версии планировщика: на другой версии
+        # PostgreSQL расхождения показываются, но проверку не роняют.
+        strict = baseline['server_version'] == server_version
+        if not strict:
+            self.stdout.write(self.style.WARNING(
+                f'Базовые планы сняты на PostgreSQL '
+                f'{baseline["server_version"]}, сервер — {server_version}: '
+                f'изменения формы планов не считаются регрессией'
+            ))
+
+        regressions = []
+        for name, captured in results.items():
+            self.stdout.write(
+                f'{name}: {captured["execution_ms"]} мс, '
+                f'буферов {captured["buffers"]}'
+            )
+            for warning in captured['warnings']:
+                self.stdout.write(self.style.WARNING(f'  {warning}'))
+            expected = baseline['plans'].get(name)
+            if expected is None:
+                regressions.append(f'{name}: нет базового плана')
+                continue
+            if captured['shape'] != expected['shape']:
+                diff = '\n'.join((
+                    f'{name}: план изменился',
+                    *difflib.unified_diff(
+                        expected['shape'], captured['shape'],
+                        'baseline', 'captured', lineterm='',
+                    ),
+                ))
+                if strict:
+                    regressions.append(diff)
+                else:
+                    self.stdout.write(self.style.WARNING(diff))
+            if name in KEYSET_QUERIES:
+                index, column = KEYSET_QUERIES[name]
+                if column not in captured['index_conds'].get(index, ''):
+                    regressions.append(
+                        f'{name}: позиция курсора не попала в Index Cond '
+                        f'индекса {index}'
+                    )
+            regressions.extend(
+                f'{name}: {warning}' for warning in captured['warnings']
+                if warning not in expected['warnings']
+            )
+        if regressions:
+            raise CommandError('\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Планы запросов не изменились'))
+
+    def get_queries(self):
+        user = User.objects.filter(followers__isnull=False).first()
+        recipe = Recipe.objects.first()
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        if not (user and recipe and len(tags) == 2):
+            raise CommandError(
+                'База данных пуста, запустите команду с флагом --seed'
+            )
+        params = {
+            'author': recipe.author_id,
+            'tag': tags[0],
+            'other_tag': tags[1],
+        }
+        page_size = LimitPagination.page_size
+        recipes = Recipe.objects.with_user_flags(user).with_relations()
+        queries = {
+            'recipes-list': get_sql(recipes[:page_size]),
+            'recipes-count': get_count_sql(recipes),
+        }
+        for name, query in RECIPE_FILTERS:
+            request = RequestFactory().get(f'/?{query.format(**params)}')
+            request.user = user
+            filtered = RecipeFilter(
+                request.GET, queryset=recipes, request=request
+            ).qs
+            queries[name] = get_sql(filtered[:page_size])
+            queries[f'{name}-count'] = get_count_sql(filtered)
+        authors = User.objects.with_subscription(user)
+        subscriptions = authors.filter(authors__follower=user)[:page_size]
+        ranked = Recipe.objects.ranked_by_author(
+            list(subscriptions.values_list('pk', flat=True)), 3
+        )
+        queries.update({
+            'shopping-list': get_sql(
+                ShoppingListItem.objects.export_rows(user)
+            ),
+            'shopping-cart-names': get_sql(Recipe.objects.filter(
+                shoppingcarts__user=user
+            ).values_list('name', flat=True)),
+            'subscriptions': get_sql(subscriptions),
+            'subscriptions-recipes': (ranked.query.sql, ranked.query.params),
+            'favorite-exists': get_sql(Favorite.objects.filter(
+                user=user, recipe=recipe
+            )[:1]),
+            'shopping-cart-exists': get_sql(ShoppingCart.objects.filter(
+                user=user, recipe=recipe
+            )[:1]),
+            'users-list': get_sql(authors[:page_size]),
+            'recipes-list-deep': get_deep_page(
+                recipes, RecipeViewSet.cursor_ordering, page_size
+            ),
+            'recipes-popular-deep': get_deep_page(
+                recipes.filter(
+                    popularity__period=DEFAULT_POPULAR_PERIOD
+                ).annotate(popularity_score=F('popularity__score')),
+                POPULAR_ORDERING,
+                page_size,
+            ),
+        })
+        return queries
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}', params
+            )
+            explained = cursor.fetchone()[0]
+        if isinstance(explained, str):
+            explained = json.loads(explained)
+        plan = explained[0]
+        warnings, index_conds = [], {}
+        for node in walk(plan['Plan']):
+            if 'Index Cond' in node:
+                index_conds[node['Index Name']] = node['Index Cond']
+            warning = self.get_warning(node)
+            if warning and warning not in warnings:
+                warnings.append(warning)
+        return {
+            'shape': list(get_shape(plan['Plan'])),
+            'warnings': warnings,
+            'index_conds': index_conds,
+            'execution_ms': round(plan['Execution Time'], 2),
+            'buffers': (
+                plan['Plan'].get('Shared Hit Blocks', 0)
+                + plan['Plan'].get('Shared Read Blocks', 0)
+            ),
+        }
+
+    def get_warning(self, node):
+        if node['Node Type'] == 'Seq Scan':
+            rows = get_rows(node) + node.get(
+                'Rows Removed by Filter', 0
+            ) * node.get('Actual Loops', 1)
+            if rows >= self.scan_rows:
+                return f'Seq Scan on {node["Relation Name"]}'
+        if node['Node Type'] in ('Sort', 'Incremental Sort'):
+            rows = sum(get_rows(child) for child in node.get('Plans', ()))
+            if rows >= self.scan_rows:
+                return f'{node["Node Type"]} by {", ".join(node["Sort Key"])}'
+        return None
+
+    def seed(self, options):
+        call_command(
+            'generate_dataset',
+            users=options['users'],
+            recipes=options['recipes'],
+            ingredients_per_recipe=options['ingredients_per_recipe'],
+            stdout=self.stdout,
+        )
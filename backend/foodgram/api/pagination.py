@@ -1,6 +1,268 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import hashlib
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core import exceptions
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db import OperationalError, connection, transaction
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def get_table_estimate(model):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            (model._meta.db_table,)
+        )
+        row = cursor.fetchone()
+    return row[0] if row else -1
+
+
+def get_plan_estimate(queryset):
+    # QuerySet.explain() склеивает строки результата, а psycopg2 уже
+    # разбирает JSON плана в список: берём план из курсора напрямую.
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def get_exact_count(queryset):
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SHOW statement_timeout')
+        (previous,) = cursor.fetchone()
+        cursor.execute(
+            'SET LOCAL statement_timeout = %s',
+            (settings.COUNT_STATEMENT_TIMEOUT,)
+        )
+        count = queryset.count()
+        cursor.execute('SET LOCAL statement_timeout = %s', (previous,))
+    return count
+
+
+def get_count(queryset):
+    """Возвращает пару (количество, приблизительно ли оно)."""
+    if connection.vendor == 'postgresql' and not queryset.query.where:
+        estimate = get_table_estimate(queryset.model)
+        if estimate >= settings.APPROXIMATE_COUNT_THRESHOLD:
+            return estimate, True
+    sql, params = queryset.query.sql_with_params()
+    key = 'count:' + hashlib.md5(repr((sql, params)).encode()).hexdigest()
+    result = cache.get(key)
+    if result is None:
+        try:
+            result = get_exact_count(queryset), False
+        except OperationalError:
+            result = get_plan_estimate(queryset), True
+        cache.set(key, result, settings.COUNT_CACHE_TIMEOUT)
+    return tuple(result)
+
+
+class CountingPaginator(Paginator):
+    invalid_number_message = 'Номер страницы должен быть целым числом'
+    empty_page_message = 'Страница не содержит результатов'
+
+    @cached_property
+    def counted(self):
+        return get_count(self.object_list)
+
+    @cached_property
+    def count(self):
+        return self.counted[0]
+
+    @property
+    def approximate(self):
+        return self.counted[1]
+
+    def page(self, number):
+        # Оценка или закешированное значение могут расходиться с таблицей,
+        # поэтому страницу не обрезаем по count, а уточняем count по лишней
+        # строке выборки.
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.invalid_number_message)
+        if number < 1:
+            raise EmptyPage(self.empty_page_message)
+        bottom = (number - 1) * self.per_page
+        objects = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not objects and number > 1:
+            raise EmptyPage(self.empty_page_message)
+        if len(objects) > self.per_page:
+            self.count = max(self.count, bottom + len(objects))
+        else:
+            self.count = bottom + len(objects)
+        self.__dict__.pop('num_pages', None)
+        return self._get_page(objects[:self.per_page], number, self)
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def __init__(self, ordering, page_size):
+        self.ordering = [
+            (field.lstrip('-'), field.startswith('-')) for field in ordering
+        ]
+        self.page_size = page_size
+
+    def encode_cursor(self, instance, reverse):
+        values = []
+        for field, _ in self.ordering:
+            value = getattr(instance, field)
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            values.append(value)
+        return base64.urlsafe_b64encode(
+            json.dumps((reverse, values)).encode()
+        ).decode()
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+        try:
+            reverse, values = json.loads(base64.urlsafe_b64decode(encoded))
+        except (binascii.Error, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or (
+            len(values) != len(self.ordering)
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            values = [
+                self.get_field(queryset, field).to_python(value)
+                for (field, _), value in zip(self.ordering, values)
+            ]
+        except (exceptions.ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in values:
+            raise NotFound(self.invalid_cursor_message)
+        return bool(reverse), values
+
+    @staticmethod
+    def get_field(queryset, field):
+        annotation = queryset.query.annotations.get(field)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(field)
+
+    def get_position_filter(self, values, reverse):
+        # a <= X AND (a < X OR b < Y) вместо a < X OR (a = X AND b < Y):
+        # первое условие PostgreSQL переносит в Index Cond, и страница
+        # читается с нужного места индекса на любой глубине.
+        position = None
+        for (field, descending), value in reversed(
+            list(zip(self.ordering, values))
+        ):
+            lookup = 'lt' if descending != reverse else 'gt'
+            after = Q(**{f'{field}__{lookup}': value})
+            if position is None:
+                position = after
+            else:
+                position = Q(**{f'{field}__{lookup}e': value}) & (
+                    after | position
+                )
+        return position
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        reverse, values = self.decode_cursor(request, queryset)
+        ordering = [
+            f'-{field}' if descending != reverse else field
+            for field, descending in self.ordering
+        ]
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(
+                self.get_position_filter(values, reverse)
+            )
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, values is not None
+        self.page = results
+        return results
+
+    def get_link(self, instance, reverse):
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(instance, reverse)
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': (
+                self.get_link(self.page[-1], False)
+                if self.has_next and self.page else None
+            ),
+            'previous': (
+                self.get_link(self.page[0], True)
+                if self.has_previous and self.page else None
+            ),
+            'results': data,
+        })
 
 
 class LimitPagination(PageNumberPagination):
+    django_paginator_class = CountingPaginator
     page_size = 6
     page_size_query_param = 'limit'
+    mode_query_param = 'pagination'
+    ordered_cursor_message = (
+        'Курсорная пагинация не сохраняет порядок выдачи фильтра, '
+        'используйте постраничную'
+    )
+    keyset = None
+
+    def use_keyset(self, request, view):
+        return getattr(view, 'cursor_ordering', None) and (
+            KeysetPagination.cursor_query_param in request.query_params
+            or request.query_params.get(self.mode_query_param) == 'cursor'
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_keyset(request, view):
+            # Фильтр со своим порядком (поиск по релевантности) курсор
+            # из полей cursor_ordering не продолжит без пропусков и повторов.
+            if queryset.query.order_by:
+                raise ValidationError(
+                    {self.mode_query_param: self.ordered_cursor_message}
+                )
+            self.keyset = KeysetPagination(
+                view.cursor_ordering, self.get_page_size(request)
+            )
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    @property
+    def count(self):
+        if self.keyset is not None:
+            return None
+        return self.page.paginator.count
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        response = super().get_paginated_response(data)
+        if self.page.paginator.approximate:
+            response.data['approximate'] = True
+        return response
@@ -0,0 +1,123 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.http import parse_http_date_safe
+
+from .conditional import get_not_modified_response, set_validators
+from recipes.catalog import get_catalog_version
+from recipes.versions import GLOBAL, author_scope, get_versions, tag_scope
+
+PAGINATION_PARAMS = frozenset(('page', 'limit', 'pagination', 'cursor'))
+WAIT_INTERVAL = 0.02
+
+
+def get_cache_params(request, filter_params):
+    """Нормализованные параметры запроса или None, если ответ не кешируем."""
+    if request.method not in ('GET', 'HEAD') or (
+        request.user.is_authenticated
+        or request.accepted_renderer.format != 'json'
+    ):
+        return None
+    params = tuple(sorted(
+        (key, tuple(sorted(request.query_params.getlist(key))))
+        for key in request.query_params
+    ))
+    # Неизвестные параметры попадают в ссылки next/previous,
+    # поэтому такие ответы не кешируем.
+    if any(
+        key not in PAGINATION_PARAMS and key not in filter_params
+        for key, _ in params
+    ):
+        return None
+    return params
+
+
+def get_scopes(params):
+    filters = dict(
+        (key, values) for key, values in params
+        if key not in PAGINATION_PARAMS
+    )
+    if not filters or not filters.keys() <= {'author', 'tags'}:
+        return (GLOBAL,)
+    return (
+        *(author_scope(author) for author in filters.get('author', ())),
+        *(tag_scope(slug) for slug in filters.get('tags', ())),
+    )
+
+
+def get_entry_versions(params):
+    return (get_catalog_version(), *get_versions(get_scopes(params)))
+
+
+def to_entry(response, versions):
+    return {
+        'versions': versions,
+        'content': response.content,
+        'content_type': response['Content-Type'],
+        'etag': response['ETag'],
+        'last_modified': parse_http_date_safe(
+            response.get('Last-Modified', '')
+        ),
+    }
+
+
+def from_entry(request, entry, state):
+    response = get_not_modified_response(
+        request, entry['etag'], entry['last_modified']
+    )
+    if response is None:
+        response = set_validators(
+            request,
+            HttpResponse(entry['content'], content_type=entry['content_type']),
+            entry['etag'],
+            entry['last_modified'],
+        )
+    response['X-Cache'] = state
+    return response
+
+
+def get_cached_response(request, filter_params, build, render):
+    """Отдаёт ответ из кеша; пересобирает его только один воркер.
+
+    Остальные воркеры на время пересборки получают устаревший ответ,
+    а если его нет, ждут готовый до RECIPES_CACHE_WAIT секунд. Блокировка
+    держится на cache.add(): на файловом кеше по умолчанию он не атомарен,
+    и изредка страницу пересоберут два воркера.
+    """
+    params = get_cache_params(request, filter_params)
+    if params is None or not settings.RECIPES_CACHE_TIMEOUT:
+        return build()
+    key = 'recipes:list:' + hashlib.md5(repr((
+        request.build_absolute_uri('/'), params
+    )).encode()).hexdigest()
+    versions = get_entry_versions(params)
+    entry = cache.get(key)
+    if entry is not None and entry['versions'] == versions:
+        return from_entry(request, entry, 'HIT')
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, settings.RECIPES_CACHE_LOCK_TIMEOUT):
+        try:
+            response = build()
+            if response.status_code == 200:
+                render(response)
+                cache.set(
+                    key,
+                    to_entry(response, versions),
+                    settings.RECIPES_CACHE_TIMEOUT,
+                )
+        finally:
+            cache.delete(lock_key)
+        response['X-Cache'] = 'MISS'
+        return response
+    if entry is not None:
+        return from_entry(request, entry, 'STALE')
+    deadline = time.monotonic() + settings.RECIPES_CACHE_WAIT
+    while time.monotonic() < deadline and cache.get(lock_key) is not None:
+        time.sleep(WAIT_INTERVAL)
+    entry = cache.get(key)
+    if entry is not None and entry['versions'] == versions:
+        return from_entry(request, entry, 'HIT')
+    return build()
@@ -1,18 +1,26 @@
+import json
+from collections import Counter
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import F
+from django.db import transaction
+from django.http import QueryDict
 from djoser.serializers import UserSerializer as DjoserUserSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.fields import SerializerMethodField
 
+from .fields import ImageVariantsField, RecipeImageField
+from recipes.bulk import bulk_create_recipes
 from recipes.constants import MIN_INGREDIENT_AMOUNT
 from recipes.models import (
     Favorite,
     Follow,
+    ImageUpload,
     Ingredient,
     Recipe,
     RecipeIngredients,
     ShoppingCart,
+    ShoppingListItem,
     Tag,
 )
 
@@ -27,6 +35,8 @@ class UsersSerializer(DjoserUserSerializer):
         fields = (*DjoserUserSerializer.Meta.fields, 'is_subscribed',)
 
     def get_is_subscribed(self, author):
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
         user = self.context.get('request').user
         return not (
             user.is_anonymous or user == author
@@ -38,7 +48,7 @@ class UsersSerializer(DjoserUserSerializer):
 
 class FollowSerializer(UsersSerializer):
     recipes = SerializerMethodField()
-    recipes_count = serializers.ReadOnlyField(source='recipes.count')
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta(UsersSerializer.Meta):
         fields = (
@@ -73,13 +83,12 @@ class FollowSerializer(UsersSerializer):
                 'Невозможно удалить несуществующую подписку')
         return data
 
-    def get_recipes(self, user):
-        request = self.context.get('request')
-        limit = int(request.GET.get('recipes_limit', 10**10))
+    def get_recipes(self, author):
         return RecipeLiteSerializer(
-            user.recipes.all()[:limit],
+            self.context.get('recipes', {}).get(author.id, ()),
             many=True,
-            read_only=True
+            read_only=True,
+            context=self.context,
         ).data
 
 
@@ -107,6 +116,7 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 
 class RecipeLiteSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -114,6 +124,7 @@ class RecipeLiteSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_variants',
             'cooking_time',
         )
         read_only_fields = ('__all__',)
@@ -128,12 +139,27 @@ class RecipeIngredientsSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount',)
 
 
+class RecipeIngredientsReadSerializer(serializers.ModelSerializer):
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
+
+    class Meta:
+        model = RecipeIngredients
+        fields = ('id', 'name', 'measurement_unit', 'amount',)
+
+
 class RecipeSafeSerializer(serializers.ModelSerializer):
     author = DjoserUserSerializer(read_only=True)
     tags = TagSerializer(many=True)
-    ingredients = serializers.SerializerMethodField()
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
+    ingredients = RecipeIngredientsReadSerializer(
+        source='recipe_ingredients', many=True, read_only=True
+    )
+    is_favorited = serializers.BooleanField(read_only=True)
+    is_in_shopping_cart = serializers.BooleanField(read_only=True)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -144,36 +170,24 @@ class RecipeSafeSerializer(serializers.ModelSerializer):
             'tags',
             'ingredients',
             'image',
+            'image_variants',
             'text',
             'cooking_time',
             'is_favorited',
             'is_in_shopping_cart',
         )
 
-    def get_ingredients(self, recipe):
-        return recipe.ingredients.values(
-            'id',
-            'name',
-            'measurement_unit',
-            amount=F('recipe_ingredients__amount')
-        )
-
-    def get_is_favorited(self, recipe):
-        user = self.context.get('request').user
-        return not user.is_anonymous and (
-            user.favorites.filter(recipe=recipe).exists()
-        )
 
-    def get_is_in_shopping_cart(self, recipe):
-        user = self.context.get('request').user
-        return not user.is_anonymous and (
-            user.shoppingcarts.filter(recipe=recipe).exists()
-        )
+def discard_upload(image):
+    upload = getattr(image, 'upload', None)
+    if upload is not None:
+        image.close()
+        upload.discard()
 
 
 class RecipeSerializer(serializers.ModelSerializer):
     author = DjoserUserSerializer(read_only=True)
-    image = Base64ImageField(required=True)
+    image = RecipeImageField(required=True)
     ingredients = RecipeIngredientsSerializer(
         source='recipe_ingredients', many=True, required=True)
     tags = serializers.PrimaryKeyRelatedField(
@@ -192,9 +206,38 @@ class RecipeSerializer(serializers.ModelSerializer):
             'cooking_time',
         )
 
+    @staticmethod
+    def parse_list(values):
+        items = []
+        for value in values:
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+            items.extend(value if isinstance(value, list) else (value,))
+        return items
+
+    def to_internal_value(self, data):
+        if isinstance(data, QueryDict):
+            # В multipart-запросе списки приходят JSON-строками
+            # или повторяющимися полями.
+            form = data
+            data = form.dict()
+            for field in ('tags', 'ingredients'):
+                if field in form:
+                    data[field] = self.parse_list(form.getlist(field))
+        return super().to_internal_value(data)
+
+    def save(self, **kwargs):
+        recipe = super().save(**kwargs)
+        discard_upload(self.validated_data.get('image'))
+        return recipe
+
     @staticmethod
     def check_duplicates(items, field_name):
-        duplicates = [item for item in items if items.count(item) > 1]
+        duplicates = [
+            item for item, count in Counter(items).items() if count > 1
+        ]
         if duplicates:
             raise serializers.ValidationError(
                 f'{field_name} не должны повторяться: {duplicates}'
@@ -204,29 +247,38 @@ class RecipeSerializer(serializers.ModelSerializer):
         ingredients_data = data.get('recipe_ingredients')
         tags_data = data.get('tags')
 
-        if not ingredients_data:
+        if not ingredients_data and (
+            not self.partial or 'recipe_ingredients' in data
+        ):
             raise serializers.ValidationError(
                 {'recipe_ingredients': 'Продукты не указаны'}
             )
-        if not tags_data:
+        if not tags_data and (not self.partial or 'tags' in data):
             raise serializers.ValidationError(
                 {'tags': 'Поле тегов обязательно'}
             )
 
-        ingredient_list = [
-            item['ingredients']['id'] for item in ingredients_data
-        ]
-        non_existing_ingredients = [
-            ingredient for ingredient in ingredient_list
-            if not Ingredient.objects.filter(id=ingredient).exists()
-        ]
-        if non_existing_ingredients:
-            raise serializers.ValidationError(
-                f'Следующие продукты не существуют: {non_existing_ingredients}'
-            )
-
-        self.check_duplicates(ingredient_list, 'Продукты')
-        self.check_duplicates(tags_data, 'Теги')
+        if ingredients_data:
+            ingredient_list = [
+                item['ingredients']['id'] for item in ingredients_data
+            ]
+            existing_ingredients = self.context.get('ingredient_ids')
+            if existing_ingredients is None:
+                existing_ingredients = set(Ingredient.objects.filter(
+                    id__in=ingredient_list
+                ).values_list('id', flat=True))
+            non_existing_ingredients = [
+                ingredient for ingredient in ingredient_list
+                if ingredient not in existing_ingredients
+            ]
+            if non_existing_ingredients:
+                raise serializers.ValidationError(
+                    'Следующие продукты не существуют: '
+                    f'{non_existing_ingredients}'
+                )
+            self.check_duplicates(ingredient_list, 'Продукты')
+        if tags_data:
+            self.check_duplicates(tags_data, 'Теги')
         return data
 
     def validate_image(self, value):
@@ -236,6 +288,7 @@ class RecipeSerializer(serializers.ModelSerializer):
             )
         return value
 
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('recipe_ingredients')
@@ -252,23 +305,157 @@ class RecipeSerializer(serializers.ModelSerializer):
                 amount=item['amount'],
             ) for item in ingredients)
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('recipe_ingredients')
-        instance.tags.clear()
-        instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.create_ingredients(instance, ingredients)
-        instance.save()
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('recipe_ingredients', None)
+        if tags is not None:
+            self.update_tags(instance, tags)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
         return super().update(instance, validated_data)
 
+    def update_tags(self, recipe, tags):
+        current = set(recipe.tags.values_list('pk', flat=True))
+        submitted = {tag.pk for tag in tags}
+        if current - submitted:
+            recipe.tags.remove(*(current - submitted))
+        if submitted - current:
+            recipe.tags.add(*(submitted - current))
+
+    def update_ingredients(self, recipe, ingredients):
+        current = {
+            row.ingredient_id: row
+            for row in recipe.recipe_ingredients.select_for_update()
+        }
+        amounts = {
+            item['ingredients']['id']: item['amount'] for item in ingredients
+        }
+        changes = {
+            ingredient: amounts.get(ingredient, 0) - (
+                current[ingredient].amount if ingredient in current else 0
+            )
+            for ingredient in current.keys() | amounts.keys()
+        }
+        removed = [
+            row.pk for ingredient, row in current.items()
+            if ingredient not in amounts
+        ]
+        changed = []
+        for ingredient, row in current.items():
+            if changes[ingredient] and ingredient in amounts:
+                row.amount = amounts[ingredient]
+                changed.append(row)
+        if removed:
+            RecipeIngredients.objects.filter(pk__in=removed).bulk_delete()
+        if changed:
+            RecipeIngredients.objects.bulk_update(changed, ('amount',))
+        self.create_ingredients(recipe, (
+            item for item in ingredients
+            if item['ingredients']['id'] not in current
+        ))
+        if any(changes.values()):
+            ShoppingListItem.objects.change_for_recipe(recipe, changes)
+
     def to_representation(self, instance):
         return RecipeSafeSerializer(
-            instance,
+            Recipe.objects.with_user_flags(
+                self.context.get('request').user
+            ).with_relations().get(pk=instance.pk),
             context=self.context
         ).data
 
 
+class RecipeBulkListSerializer(serializers.ListSerializer):
+
+    @staticmethod
+    def collect_ids(values):
+        ids = set()
+        for value in values:
+            try:
+                ids.add(int(value))
+            except (TypeError, ValueError):
+                pass
+        return ids
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            items = [item for item in data if isinstance(item, dict)]
+            # Ссылки всех рецептов проверяем двумя запросами,
+            # а не отдельно для каждого рецепта.
+            self._context.update({
+                'tags': Tag.objects.in_bulk(self.collect_ids(
+                    tag
+                    for item in items
+                    if isinstance(item.get('tags'), list)
+                    for tag in item['tags']
+                )),
+                'ingredient_ids': set(Ingredient.objects.filter(
+                    id__in=self.collect_ids(
+                        ingredient.get('id')
+                        for item in items
+                        if isinstance(item.get('ingredients'), list)
+                        for ingredient in item['ingredients']
+                        if isinstance(ingredient, dict)
+                    )
+                ).values_list('id', flat=True)),
+            })
+        return super().to_internal_value(data)
+
+    def create(self, validated_data):
+        entries = []
+        for item in validated_data:
+            tags = item.pop('tags')
+            ingredients = item.pop('recipe_ingredients')
+            entries.append((
+                Recipe(**item),
+                [tag.pk for tag in tags],
+                {
+                    ingredient['ingredients']['id']: ingredient['amount']
+                    for ingredient in ingredients
+                },
+            ))
+        return bulk_create_recipes(entries)
+
+    def save(self, **kwargs):
+        recipes = super().save(**kwargs)
+        for item in self.validated_data:
+            discard_upload(item.get('image'))
+        return recipes
+
+
+class RecipeBulkSerializer(RecipeSerializer):
+    tags = serializers.ListField(
+        child=serializers.IntegerField(), required=True
+    )
+
+    class Meta(RecipeSerializer.Meta):
+        list_serializer_class = RecipeBulkListSerializer
+
+    def validate_tags(self, tag_ids):
+        tags = self.context['tags']
+        non_existing_tags = [tag for tag in tag_ids if tag not in tags]
+        if non_existing_tags:
+            raise serializers.ValidationError(
+                f'Следующие теги не существуют: {non_existing_tags}'
+            )
+        return [tags[tag] for tag in tag_ids]
+
+    def to_representation(self, instance):
+        return RecipeLiteSerializer(instance, context=self.context).data
+
+
+class ImageUploadSerializer(serializers.ModelSerializer):
+    size = serializers.IntegerField(
+        min_value=1, max_value=settings.IMAGE_UPLOAD_MAX_SIZE
+    )
+
+    class Meta:
+        model = ImageUpload
+        fields = ('id', 'size', 'offset',)
+        read_only_fields = ('offset',)
+
+
 class RecipeRelationSerializer(serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
     recipe = serializers.PrimaryKeyRelatedField(queryset=Recipe.objects.all())
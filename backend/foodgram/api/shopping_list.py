@@ -0,0 +1,160 @@
+import csv
+import io
+import json
+import os
+from datetime import date
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
+from rest_framework.negotiation import BaseContentNegotiation
+
+RENDERERS = {}
+
+
+def register(renderer):
+    RENDERERS[renderer.format] = renderer
+    return renderer
+
+
+class ShoppingListContentNegotiation(BaseContentNegotiation):
+    """Не даёт DRF трактовать ?format= как выбор DRF-рендерера."""
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class ShoppingListRenderer:
+    format = None
+    content_type = None
+
+    def __init__(self, user, ingredients, recipes):
+        self.user = user
+        self.ingredients = ingredients
+        self.recipes = recipes
+        self.date = date.today().strftime('%d-%m-%Y')
+
+    @property
+    def filename(self):
+        return f'shopping_cart.{self.format}'
+
+    def render(self):
+        raise NotImplementedError
+
+
+@register
+class TextShoppingListRenderer(ShoppingListRenderer):
+    format = 'txt'
+    content_type = 'text/plain; charset=utf-8'
+
+    def render(self):
+        yield (
+            f'Дата: {self.date}\n\n'
+            f'Список покупок пользователя {self.user}:\n'
+        )
+        for index, item in enumerate(self.ingredients, start=1):
+            yield (
+                f'{index}. {item["ingredient__name"].capitalize()} - '
+                f'{item["total_amount"]} '
+                f'({item["ingredient__measurement_unit"]})\n'
+            )
+        yield '\nРецепты:\n'
+        for index, recipe in enumerate(self.recipes, start=1):
+            yield f'{index}. {recipe}\n'
+
+
+@register
+class CsvShoppingListRenderer(ShoppingListRenderer):
+    format = 'csv'
+    content_type = 'text/csv; charset=utf-8'
+
+    def render(self):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(('Продукт', 'Количество', 'Единица измерения'))
+        for item in self.ingredients:
+            writer.writerow((
+                item['ingredient__name'],
+                item['total_amount'],
+                item['ingredient__measurement_unit'],
+            ))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+
+@register
+class JsonShoppingListRenderer(ShoppingListRenderer):
+    format = 'json'
+    content_type = 'application/json'
+
+    def render(self):
+        yield (
+            f'{{"date": {json.dumps(self.date)}, '
+            f'"user": {json.dumps(str(self.user), ensure_ascii=False)}, '
+            f'"ingredients": ['
+        )
+        separator = ''
+        for item in self.ingredients:
+            yield separator + json.dumps({
+                'name': item['ingredient__name'],
+                'measurement_unit': item['ingredient__measurement_unit'],
+                'amount': item['total_amount'],
+            }, ensure_ascii=False)
+            separator = ', '
+        yield '], "recipes": ['
+        separator = ''
+        for recipe in self.recipes:
+            yield separator + json.dumps(str(recipe), ensure_ascii=False)
+            separator = ', '
+        yield ']}'
+
+
+@register
+class PdfShoppingListRenderer(ShoppingListRenderer):
+    format = 'pdf'
+    content_type = 'application/pdf'
+    font_size = 11
+    margin = 50
+
+    @staticmethod
+    def get_font():
+        font = settings.SHOPPING_LIST_FONT
+        if not os.path.exists(font):
+            return 'Helvetica'
+        if 'ShoppingList' not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont('ShoppingList', font))
+        return 'ShoppingList'
+
+    def render(self):
+        # ReportLab пишет документ только в canvas.save(), поэтому PDF,
+        # в отличие от остальных форматов, строится в памяти целиком.
+        # Размер ограничен числом разных продуктов в списке.
+        buffer = io.BytesIO()
+        canvas = Canvas(buffer, pagesize=A4)
+        font = self.get_font()
+        width, height = A4
+        chunks = TextShoppingListRenderer(
+            self.user, self.ingredients, self.recipes
+        ).render()
+        text = None
+        for chunk in chunks:
+            for line in chunk.splitlines():
+                if text is None or text.getY() < self.margin:
+                    if text is not None:
+                        canvas.drawText(text)
+                        canvas.showPage()
+                    text = canvas.beginText(
+                        self.margin, height - self.margin
+                    )
+                    text.setFont(font, self.font_size)
+                text.textLine(line)
+        canvas.drawText(text)
+        canvas.save()
+        yield buffer.getvalue()
@@ -3,6 +3,7 @@ from rest_framework.routers import DefaultRouter
 
 from .views import (
     UserViewSet,
+    ImageUploadViewSet,
     IngredientViewSet,
     RecipeViewSet,
     TagViewSet,
@@ -15,6 +16,7 @@ router.register(r'recipes', RecipeViewSet, basename='recipes')
 router.register(r'users', UserViewSet, basename='users')
 router.register(r'tags', TagViewSet, basename='tags')
 router.register(r'ingredients', IngredientViewSet, basename='ingredients')
+router.register(r'uploads', ImageUploadViewSet, basename='uploads')
 
 urlpatterns = [
     path('', include(router.urls)),
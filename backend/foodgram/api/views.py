@@ -1,54 +1,121 @@
+import os
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import FileResponse
+from django.db import transaction
+from django.db.models import F
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.mixins import (
+    CreateModelMixin,
+    DestroyModelMixin,
+    RetrieveModelMixin,
+)
 from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
 from rest_framework.response import Response
 from rest_framework.status import (
     HTTP_201_CREATED,
     HTTP_204_NO_CONTENT,
+    HTTP_409_CONFLICT,
+)
+from rest_framework.viewsets import (
+    GenericViewSet,
+    ModelViewSet,
+    ReadOnlyModelViewSet,
 )
-from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
-from .filters import IngredientSearchFilter, RecipeFilter
-from .pagination import LimitPagination
+from .catalog import CatalogListMixin, get_ingredient_index
+from .conditional import (
+    get_not_modified_response,
+    get_recipes_validators,
+    set_validators,
+)
+from .filters import RecipeFilter
+from .pagination import KeysetPagination, LimitPagination
 from .permissions import AuthorOrReadOnly
+from .response_cache import get_cached_response
 from .serializers import (
     FavoriteSerializer,
     FollowSerializer,
+    ImageUploadSerializer,
     IngredientSerializer,
+    RecipeBulkSerializer,
     RecipeSafeSerializer,
     RecipeSerializer,
     ShoppingCartSerializer,
     TagSerializer,
 )
+from .shopping_list import (
+    RENDERERS as SHOPPING_LIST_RENDERERS,
+    ShoppingListContentNegotiation,
+)
+from recipes.constants import (
+    DEFAULT_POPULAR_PERIOD,
+    DEFAULT_RECIPES_LIMIT,
+    MAX_RECIPES_LIMIT,
+    POPULAR_PERIODS,
+    UPLOAD_BLOCK_SIZE,
+)
 from recipes.models import (
     Favorite,
     Follow,
     Ingredient,
     Recipe,
-    RecipeIngredients,
     ShoppingCart,
+    ShoppingListItem,
     Tag,
 )
-from .utils import generate_shopping_list_text
 
 
 User = get_user_model()
 
+EXPORT_CHUNK_SIZE = 2000
+POPULAR_ORDERING = ('-popularity_score', '-id')
+
 
 class UserViewSet(DjoserUserViewSet):
     queryset = User.objects.all()
     pagination_class = LimitPagination
+    cursor_ordering = ('username', 'id')
 
     def get_permissions(self):
         if self.action == 'me':
             return (IsAuthenticated(), AuthorOrReadOnly(),)
         return super().get_permissions()
 
+    def get_queryset(self):
+        return super().get_queryset().with_subscription(self.request.user)
+
+    def get_follow_data(self, authors):
+        request = self.request
+        try:
+            limit = int(request.GET.get(
+                'recipes_limit', DEFAULT_RECIPES_LIMIT
+            ))
+        except ValueError:
+            raise ValidationError(
+                {'recipes_limit': 'Ожидается целое число'}
+            )
+        authors = list(authors)
+        return FollowSerializer(
+            authors,
+            many=True,
+            context={
+                'request': request,
+                'recipes': Recipe.objects.latest_by_author(
+                    [author.id for author in authors],
+                    min(max(limit, 0), MAX_RECIPES_LIMIT),
+                ),
+            }
+        ).data
+
+    def get_follow_queryset(self):
+        return User.objects.with_subscription(self.request.user)
+
     @action(
         detail=True,
         methods=('post', 'delete',),
@@ -65,8 +132,14 @@ class UserViewSet(DjoserUserViewSet):
         serializer.is_valid(raise_exception=True)
 
         if request.method == 'POST':
-            Follow.objects.create(follower=follower, author=author)
-            return Response(serializer.data, status=HTTP_201_CREATED)
+            with transaction.atomic():
+                Follow.objects.create(follower=follower, author=author)
+            return Response(
+                self.get_follow_data(
+                    self.get_follow_queryset().filter(pk=author.pk)
+                )[0],
+                status=HTTP_201_CREATED
+            )
 
         get_object_or_404(Follow, follower=follower, author=author).delete()
         return Response(status=HTTP_204_NO_CONTENT)
@@ -76,25 +149,73 @@ class UserViewSet(DjoserUserViewSet):
         permission_classes=(IsAuthenticated,)
     )
     def subscriptions(self, request):
-        serializer = FollowSerializer(
-            self.paginate_queryset(
-                User.objects.filter(
-                    authors__follower=request.user
-                )
-            ),
-            many=True,
-            context={'request': request}
-        )
-        return self.get_paginated_response(serializer.data)
+        return self.get_paginated_response(self.get_follow_data(
+            self.paginate_queryset(self.get_follow_queryset().filter(
+                authors__follower=request.user
+            ))
+        ))
 
 
 class RecipeViewSet(ModelViewSet):
     queryset = Recipe.objects.all()
     pagination_class = LimitPagination
+    cursor_ordering = ('-pub_date', '-id')
     permission_classes = (AuthorOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        if self.request.method in SAFE_METHODS:
+            return Recipe.objects.with_user_flags(
+                self.request.user
+            ).with_relations()
+        return super().get_queryset()
+
+    def list(self, request, *args, **kwargs):
+        return get_cached_response(
+            request,
+            self.filterset_class.base_filters,
+            lambda: self.get_list_response(request),
+            lambda response: self.finalize_response(
+                request, response
+            ).render(),
+        )
+
+    def get_list_response(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            recipes = list(queryset)
+            count = len(recipes)
+        else:
+            recipes = page
+            count = self.paginator.count
+        etag, last_modified = get_recipes_validators(
+            recipes, request.get_full_path(), count, listing=True
+        )
+        response = get_not_modified_response(request, etag, last_modified)
+        if response is not None:
+            return response
+        data = self.get_serializer(recipes, many=True).data
+        if page is None:
+            response = Response(data)
+        else:
+            response = self.get_paginated_response(data)
+        return set_validators(request, response, etag, last_modified)
+
+    def retrieve(self, request, *args, **kwargs):
+        recipe = self.get_object()
+        etag, last_modified = get_recipes_validators((recipe,))
+        response = get_not_modified_response(request, etag, last_modified)
+        if response is not None:
+            return response
+        return set_validators(
+            request,
+            Response(self.get_serializer(recipe).data),
+            etag,
+            last_modified,
+        )
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -103,6 +224,44 @@ class RecipeViewSet(ModelViewSet):
             return RecipeSafeSerializer
         return RecipeSerializer
 
+    @action(
+        detail=False,
+        methods=('POST',),
+        permission_classes=(IsAuthenticated,),
+    )
+    def bulk(self, request):
+        serializer = RecipeBulkSerializer(
+            data=request.data,
+            many=True,
+            allow_empty=False,
+            max_length=settings.RECIPES_BULK_MAX_SIZE,
+            context=self.get_serializer_context(),
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save(author=request.user)
+        return Response(serializer.data, status=HTTP_201_CREATED)
+
+    @action(detail=False)
+    def popular(self, request):
+        period = request.query_params.get('period', DEFAULT_POPULAR_PERIOD)
+        if period not in dict(POPULAR_PERIODS):
+            raise ValidationError({'period': (
+                f'Поддерживаемые периоды: '
+                f'{", ".join(dict(POPULAR_PERIODS))}'
+            )})
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            popularity__period=period
+        ).annotate(popularity_score=F('popularity__score'))
+        # Без подсчёта строк страница читается по индексу рейтинга,
+        # сколько бы записей ни было в избранном.
+        paginator = KeysetPagination(
+            POPULAR_ORDERING, self.paginator.get_page_size(request)
+        )
+        page = paginator.paginate_queryset(queryset, request, self)
+        return paginator.get_paginated_response(
+            self.get_serializer(page, many=True).data
+        )
+
     @staticmethod
     def add_to_delete_from(request, pk, model, serializer):
         if request.method == 'POST':
@@ -111,7 +270,8 @@ class RecipeViewSet(ModelViewSet):
                 context={'request': request}
             )
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
             return Response(serializer.data, status=HTTP_201_CREATED)
         get_object_or_404(
             model,
@@ -138,38 +298,117 @@ class RecipeViewSet(ModelViewSet):
         url_name='download_shopping_cart',
         url_path='download_shopping_cart',
         permission_classes=(IsAuthenticated,),
+        content_negotiation_class=ShoppingListContentNegotiation,
     )
     def download_shopping_cart(self, request):
         user = self.request.user
-        shopping_list = RecipeIngredients.objects.filter(
-            recipe__shoppingcarts__user=user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(total_amount=Sum('amount'))
-        recipes = [
-            recipe for recipe in Recipe.objects.filter(
+        export_format = request.query_params.get('format', 'txt')
+        if export_format not in SHOPPING_LIST_RENDERERS:
+            raise ValidationError({'format': (
+                f'Поддерживаемые форматы: '
+                f'{", ".join(SHOPPING_LIST_RENDERERS)}'
+            )})
+        renderer = SHOPPING_LIST_RENDERERS[export_format](
+            user,
+            ShoppingListItem.objects.export_rows(user).iterator(
+                chunk_size=EXPORT_CHUNK_SIZE
+            ),
+            Recipe.objects.filter(
                 shoppingcarts__user=user
-            )
-        ]
-        return FileResponse(
-            generate_shopping_list_text(
-                user,
-                shopping_list,
-                recipes
+            ).values_list('name', flat=True).iterator(
+                chunk_size=EXPORT_CHUNK_SIZE
             ),
-            content_type='text',
-            filename='shopping_cart.txt'
         )
+        response = StreamingHttpResponse(
+            renderer.render(),
+            content_type=renderer.content_type,
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{renderer.filename}"'
+        )
+        return response
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(CatalogListMixin, ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (IngredientSearchFilter,)
-    search_fields = ('^name',)
+    catalog_name = 'ingredients'
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name is None:
+            return super().list(request, *args, **kwargs)
+        try:
+            limit = int(request.query_params.get('limit', 0))
+        except ValueError:
+            raise ValidationError({'limit': 'Ожидается целое число'})
+        return Response(get_ingredient_index().search(
+            name, limit if limit > 0 else None
+        ))
 
-class TagViewSet(ReadOnlyModelViewSet):
+
+class TagViewSet(CatalogListMixin, ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    catalog_name = 'tags'
+
+
+class ImageUploadViewSet(
+    CreateModelMixin,
+    RetrieveModelMixin,
+    DestroyModelMixin,
+    GenericViewSet,
+):
+    serializer_class = ImageUploadSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        return self.request.user.image_uploads.all()
+
+    def perform_create(self, serializer):
+        upload = serializer.save(user=self.request.user)
+        os.makedirs(settings.UPLOADS_TEMP_DIR, exist_ok=True)
+        open(upload.path, 'wb').close()
+
+    def perform_destroy(self, upload):
+        upload.discard()
+
+    def partial_update(self, request, *args, **kwargs):
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers.get('Content-Length') or 0)
+        except (KeyError, ValueError):
+            raise ValidationError(
+                {'Upload-Offset': 'Ожидается смещение фрагмента в байтах'}
+            )
+        if length > settings.UPLOAD_CHUNK_MAX_SIZE:
+            raise ValidationError({'Content-Length': (
+                'Фрагмент не может быть больше '
+                f'{settings.UPLOAD_CHUNK_MAX_SIZE} байт'
+            )})
+        with transaction.atomic():
+            upload = get_object_or_404(
+                self.get_queryset().select_for_update(), pk=kwargs['pk']
+            )
+            if offset != upload.offset:
+                return Response(
+                    self.get_serializer(upload).data,
+                    status=HTTP_409_CONFLICT,
+                )
+            if offset + length > upload.size:
+                raise ValidationError(
+                    {'Content-Length': 'Фрагмент выходит за размер файла'}
+                )
+            with open(upload.path, 'r+b') as file:
+                file.seek(offset)
+                file.truncate()
+                while file.tell() < offset + length:
+                    block = request.stream.read(
+                        min(UPLOAD_BLOCK_SIZE, offset + length - file.tell())
+                    )
+                    if not block:
+                        break
+                    file.write(block)
+                upload.offset = file.tell()
+            upload.save(update_fields=('offset',))
+        return Response(self.get_serializer(upload).data)
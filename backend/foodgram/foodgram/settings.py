@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -77,6 +78,47 @@ else:
         }
     }
 
+# Файловый кеш общий только для воркеров одного контейнера, а его add()
+# не атомарен: блокировка пересборки списков рецептов на нём лишь
+# уменьшает число одновременных пересборок. Для строгой блокировки укажите
+# бэкенд с атомарным add(), например Memcached.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram_cache')
+        ),
+    }
+}
+
+CATALOG_MAX_AGE = int(os.getenv('CATALOG_MAX_AGE', 300))
+
+APPROXIMATE_COUNT_THRESHOLD = int(
+    os.getenv('APPROXIMATE_COUNT_THRESHOLD', 100000)
+)
+COUNT_STATEMENT_TIMEOUT = int(os.getenv('COUNT_STATEMENT_TIMEOUT', 200))
+COUNT_CACHE_TIMEOUT = int(os.getenv('COUNT_CACHE_TIMEOUT', 30))
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+RECIPES_CACHE_TIMEOUT = int(os.getenv('RECIPES_CACHE_TIMEOUT', 300))
+RECIPES_CACHE_LOCK_TIMEOUT = 10
+RECIPES_CACHE_WAIT = 2
+
+RECIPES_BULK_MAX_SIZE = int(os.getenv('RECIPES_BULK_MAX_SIZE', 1000))
+
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+IMAGE_UPLOAD_MAX_SIZE = int(os.getenv('IMAGE_UPLOAD_MAX_SIZE', 10 * 1024 * 1024))
+UPLOAD_CHUNK_MAX_SIZE = int(os.getenv('UPLOAD_CHUNK_MAX_SIZE', 1024 * 1024))
+UPLOADS_TEMP_DIR = os.getenv(
+    'UPLOADS_TEMP_DIR',
+    os.path.join(tempfile.gettempdir(), 'foodgram_uploads')
+)
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -137,3 +179,11 @@ DJOSER = {
 }
 
 IMPORT_FOLDER = os.path.join(BASE_DIR, 'data')
+
+API_BUDGET_FILE = os.path.join(BASE_DIR, 'api', 'budget.json')
+
+QUERY_PLANS_FILE = os.path.join(BASE_DIR, 'api', 'plans.json')
+
+SHOPPING_LIST_FONT = os.getenv(
+    'SHOPPING_LIST_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
@@ -3,7 +3,7 @@ from ast import literal_eval
 from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
-from django.db.models import Q
+from django.db.models import Count, Q
 from django.utils.safestring import mark_safe
 
 from .constants import FAST_COOKING, SLOW_COOKING
@@ -52,31 +52,27 @@ class CookingTimeFilter(admin.SimpleListFilter):
         medium = (FAST_COOKING, SLOW_COOKING)
         slow = (SLOW_COOKING + 1, 10**10)
 
-        fast_recipes_count = Recipe.objects.filter(
-            cooking_time__range=fast
-        ).count()
-        medium_recipes_count = Recipe.objects.filter(
-            cooking_time__range=medium
-        ).count()
-        slow_recipes_count = Recipe.objects.filter(
-            cooking_time__range=slow
-        ).count()
+        counts = Recipe.objects.aggregate(
+            fast=Count('pk', filter=Q(cooking_time__range=fast)),
+            medium=Count('pk', filter=Q(cooking_time__range=medium)),
+            slow=Count('pk', filter=Q(cooking_time__range=slow)),
+        )
 
         return (
             (
                 fast,
                 f'Быстрые (< {FAST_COOKING} мин) '
-                f'({fast_recipes_count})'
+                f'({counts["fast"]})'
             ),
             (
                 medium,
                 f'Средние ({FAST_COOKING} - {SLOW_COOKING} мин) '
-                f'({medium_recipes_count})'
+                f'({counts["medium"]})'
             ),
             (
                 slow,
                 f'Долгие (> {SLOW_COOKING} мин) '
-                f'({slow_recipes_count})'
+                f'({counts["slow"]})'
             ),
         )
 
@@ -94,9 +90,9 @@ class UserAdmin(DjangoUserAdmin):
         'first_name',
         'last_name',
         'email',
-        'total_recipes',
-        'total_followers',
-        'total_subscriptions',
+        'recipes_count',
+        'followers_count',
+        'subscriptions_count',
     )
     search_fields = (
         'username',
@@ -104,18 +100,6 @@ class UserAdmin(DjangoUserAdmin):
     )
     list_filter = (SubscriptionsFollowersFilter,)
 
-    @admin.display(description='Рецепты')
-    def total_recipes(self, recipe):
-        return recipe.recipes.count()
-
-    @admin.display(description='Подписки')
-    def total_subscriptions(self, user):
-        return user.followers.count()
-
-    @admin.display(description='Подписчики')
-    def total_followers(self, user):
-        return user.authors.count()
-
 
 @admin.register(Follow)
 class FollowAdmin(admin.ModelAdmin):
@@ -147,7 +131,7 @@ class RecipeAdmin(admin.ModelAdmin):
         'cooking_time',
         'display_tags',
         'display_ingredients',
-        'total_favorite',
+        'favorites_count',
         'pub_date',
     )
     search_fields = (
@@ -167,15 +151,14 @@ class RecipeAdmin(admin.ModelAdmin):
         IngredientInline,
     )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_relations()
+
     @admin.display(description='Изображение')
     @mark_safe
     def display_image(self, recipe):
         return f'<img src="{recipe.image.url}" width="80" height="60">'
 
-    @admin.display(description='В избранном')
-    def total_favorite(self, recipe):
-        return recipe.favorites.count()
-
     @admin.display(description='Теги')
     @mark_safe
     def display_tags(self, recipe):
@@ -197,7 +180,7 @@ class IngredientAdmin(admin.ModelAdmin):
     list_display = (
         'name',
         'measurement_unit',
-        'used_in_recipes_count',
+        'recipes_count',
     )
     search_fields = (
         'name',
@@ -207,10 +190,6 @@ class IngredientAdmin(admin.ModelAdmin):
         'measurement_unit',
     )
 
-    @admin.display(description='В рецептах')
-    def used_in_recipes_count(self, ingredient):
-        return RecipeIngredients.objects.filter(ingredient=ingredient).count()
-
 
 @admin.register(RecipeIngredients)
 class RecipeIngredientsAdmin(admin.ModelAdmin):
@@ -247,6 +226,7 @@ class FavoriteAdmin(admin.ModelAdmin):
     list_display = (
         'recipe',
         'user',
+        'created_at',
     )
     search_fields = (
         'user__username',
@@ -0,0 +1,123 @@
+import csv
+import io
+from itertools import islice
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from .images import schedule_variants
+from .models import Recipe, RecipeIngredients
+from .versions import recipes_changed
+
+BATCH_SIZE = 10000
+
+
+def batches(rows, batch_size=BATCH_SIZE):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def bulk_insert(model, field_names, rows, batch_size=BATCH_SIZE):
+    fields = [model._meta.get_field(name) for name in field_names]
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(
+        connection.ops.quote_name(field.column) for field in fields
+    )
+    inserted = 0
+    with connection.cursor() as cursor:
+        for batch in batches(rows, batch_size):
+            prepared = [
+                [
+                    field.get_db_prep_save(value, connection)
+                    for field, value in zip(fields, row)
+                ]
+                for row in batch
+            ]
+            if connection.vendor == 'postgresql':
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(prepared)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f'COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)',
+                    buffer,
+                )
+            else:
+                placeholders = ', '.join(['%s'] * len(fields))
+                cursor.executemany(
+                    f'INSERT INTO {table} ({columns}) '
+                    f'VALUES ({placeholders})',
+                    prepared,
+                )
+            inserted += len(batch)
+    return inserted
+
+
+def next_pk(model):
+    last = model.objects.order_by('-pk').values_list('pk', flat=True).first()
+    return (last or 0) + 1
+
+
+def reset_sequences(*models):
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+
+def analyze(*models):
+    # Без свежей статистики планировщик считает таблицы, заполненные
+    # в этой же транзакции, пустыми.
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        for model in models:
+            cursor.execute(
+                f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}'
+            )
+
+
+def bulk_create_recipes(entries, batch_size=BATCH_SIZE):
+    """Создаёт рецепты вместе со связями несколькими bulk_create.
+
+    entries — тройки (рецепт, теги, {продукт: количество}) с id тегов
+    и продуктов. bulk_create не отправляет сигналы, поэтому сброс кеша
+    и подготовку изображений запускаем здесь.
+    """
+    entries = list(entries)
+    recipes = [recipe for recipe, _, _ in entries]
+    with transaction.atomic():
+        if connection.features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes, batch_size=batch_size)
+            for recipe in recipes:
+                if recipe.image:
+                    schedule_variants(recipe)
+        else:
+            # Без RETURNING bulk_create не заполняет id рецептов.
+            for recipe in recipes:
+                recipe.save(force_insert=True)
+        Recipe.tags.through.objects.bulk_create(
+            (
+                Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag)
+                for recipe, tags, _ in entries for tag in tags
+            ),
+            batch_size=batch_size,
+        )
+        RecipeIngredients.objects.bulk_create(
+            (
+                RecipeIngredients(
+                    recipe_id=recipe.pk,
+                    ingredient_id=ingredient,
+                    amount=amount,
+                )
+                for recipe, _, amounts in entries
+                for ingredient, amount in amounts.items()
+            ),
+            batch_size=batch_size,
+        )
+        recipes_changed([recipe.pk for recipe in recipes])
+    return recipes
@@ -7,3 +7,14 @@ MIN_TIME = 1
 MIN_INGREDIENT_AMOUNT = 1
 FAST_COOKING = 30
 SLOW_COOKING = 60
+DEFAULT_RECIPES_LIMIT = 3
+MAX_RECIPES_LIMIT = 50
+UPLOAD_BLOCK_SIZE = 64 * 1024
+CONTENT_FORMAT_VERSION = 1
+POPULAR_PERIODS = (
+    ('day', 'За сутки'),
+    ('week', 'За неделю'),
+    ('all', 'За всё время'),
+)
+DEFAULT_POPULAR_PERIOD = 'week'
+MAX_LENGTH_PERIOD = 10
@@ -0,0 +1,79 @@
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+def get_counters():
+    from .models import (
+        Favorite,
+        Follow,
+        Ingredient,
+        Recipe,
+        RecipeIngredients,
+        User,
+    )
+
+    return {
+        Recipe: {'favorites_count': (Favorite, 'recipe')},
+        User: {
+            'recipes_count': (Recipe, 'author'),
+            'followers_count': (Follow, 'author'),
+            'subscriptions_count': (Follow, 'follower'),
+        },
+        Ingredient: {'recipes_count': (RecipeIngredients, 'ingredient')},
+    }
+
+
+class CountersModelMixin:
+    """Не даёт save() существующей записи затереть счётчики значениями,
+    устаревшими с момента загрузки: счётчики меняют только F()-обновления."""
+
+    def save(
+        self, force_insert=False, force_update=False, using=None,
+        update_fields=None,
+    ):
+        if not self._state.adding and not force_insert:
+            counters = get_counters()[self._meta.concrete_model]
+            if update_fields is None:
+                deferred = self.get_deferred_fields()
+                update_fields = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key
+                    and field.attname not in deferred
+                ]
+            update_fields = [
+                name for name in update_fields if name not in counters
+            ]
+        super().save(force_insert, force_update, using, update_fields)
+
+
+def count_related(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')}).order_by()
+            .values(field).annotate(count=Count('pk')).values('count')
+        ),
+        0,
+    )
+
+
+def refresh_counters():
+    """Пересчитывает все счётчики одним UPDATE на каждый, для загрузок."""
+    for model, counters in get_counters().items():
+        model.objects.update(**{
+            field: count_related(*related)
+            for field, related in counters.items()
+        })
+
+
+def change_counter(model, field, ids, sign=1):
+    """Меняет счётчик на число вхождений id; id могут повторяться."""
+    by_delta = defaultdict(list)
+    for pk, count in Counter(ids).items():
+        by_delta[count * sign].append(pk)
+    for delta, pks in by_delta.items():
+        value = F(field) + delta
+        if delta < 0:
+            value = Greatest(value, 0)
+        model.objects.filter(pk__in=pks).update(**{field: value})
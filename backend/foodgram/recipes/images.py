@@ -0,0 +1,171 @@
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .storage import image_storage, lock_file
+from .versions import recipes_changed
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = {
+    'thumbnail': (240, 240),
+    'card': (640, 640),
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+VARIANTS_DIR = 'recipes/images/variants'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def render_variants(file):
+    with Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGB')
+    for variant, size in VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        for extension, (image_format, options) in FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(buffer, image_format, **options)
+            yield variant, extension, buffer.getvalue()
+
+
+def save_variants(name, storage=image_storage):
+    variants = {'source': name}
+    with storage.open(name) as file:
+        for variant, extension, content in render_variants(file):
+            variants.setdefault(variant, {})[extension] = storage.save(
+                f'{VARIANTS_DIR}/{variant}.{extension}',
+                ContentFile(content),
+            )
+    return variants
+
+
+def variant_names(variants):
+    return {
+        name
+        for variant in VARIANTS
+        for name in variants.get(variant, {}).values()
+    }
+
+
+def get_used_variants(file_names, source):
+    """Варианты из file_names, на которые ссылаются рецепты с другим
+    исходным изображением: варианты разных изображений могут совпасть
+    побайтно и храниться в одном файле."""
+    from .models import Recipe
+
+    lookup = reduce(or_, (
+        Q(**{f'image_variants__{variant}__{extension}__in': file_names})
+        for variant in VARIANTS
+        for extension in FORMATS
+    ))
+    return file_names & {
+        name
+        for variants in Recipe.objects.filter(lookup).exclude(
+            image_variants__source=source
+        ).values_list('image_variants', flat=True)
+        for name in variant_names(variants)
+    }
+
+
+def release_variants(file_names, source, storage=image_storage):
+    """Удаляет варианты изображения source, которые не нужны другим
+    рецептам."""
+    file_names = set(file_names)
+    if not file_names:
+        return
+    with transaction.atomic():
+        for file_name in sorted(file_names):
+            lock_file(file_name)
+        for file_name in file_names - get_used_variants(file_names, source):
+            storage.delete(file_name)
+
+
+def release_image(name, variants, storage=image_storage):
+    """Удаляет файл и его варианты, если на них больше не ссылается
+    ни один рецепт: одинаковые изображения хранятся в одном файле."""
+    from .models import Recipe
+
+    if not name:
+        return
+    with transaction.atomic():
+        # Рецепт, который прямо сейчас сохраняет этот же файл, держит
+        # блокировку до коммита: дожидаемся его и проверяем ссылки заново.
+        lock_file(name)
+        if Recipe.objects.filter(image=name).exists():
+            return
+        storage.delete(name)
+        release_variants(variant_names(variants), name, storage)
+
+
+def generate_variants(recipe_id, name):
+    from .models import Recipe
+
+    if not Recipe.objects.filter(pk=recipe_id, image=name).exists():
+        return None
+    # Блокировки вариантов, взятые при сохранении, держатся до записи
+    # ссылки на них.
+    with transaction.atomic():
+        variants = Recipe.objects.filter(
+            image=name, image_variants__source=name
+        ).values_list('image_variants', flat=True).first()
+        if variants:
+            for file_name in sorted(variant_names(variants)):
+                lock_file(file_name)
+        else:
+            variants = save_variants(name)
+        updated = Recipe.objects.filter(pk=recipe_id, image=name).update(
+            image_variants=variants, updated_at=timezone.now()
+        )
+    if updated:
+        recipes_changed((recipe_id,))
+    else:
+        release_image(name, variants)
+    return variants
+
+
+def run_generate_variants(recipe_id, name):
+    try:
+        return generate_variants(recipe_id, name)
+    except Exception:
+        logger.exception(
+            'Не удалось подготовить изображения рецепта %s', recipe_id
+        )
+    finally:
+        connection.close()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                thread_name_prefix='recipe-images',
+            )
+        return _executor
+
+
+def schedule_variants(recipe):
+    recipe_id, name = recipe.pk, recipe.image.name
+    if settings.IMAGE_WORKERS:
+        transaction.on_commit(lambda: get_executor().submit(
+            run_generate_variants, recipe_id, name
+        ))
+    else:
+        transaction.on_commit(lambda: generate_variants(recipe_id, name))
@@ -0,0 +1,38 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.models import ImageUpload
+
+
+class Command(BaseCommand):
+    help = 'Delete abandoned image uploads and their temporary files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int, default=24,
+            help='Delete uploads started more than this many hours ago',
+        )
+
+    def handle(self, *args, **options):
+        deleted = 0
+        for upload in ImageUpload.objects.filter(
+            created_at__lt=timezone.now() - timedelta(hours=options['hours'])
+        ).iterator():
+            upload.discard()
+            deleted += 1
+        if os.path.isdir(settings.UPLOADS_TEMP_DIR):
+            known = {
+                upload_id.hex for upload_id in
+                ImageUpload.objects.values_list('id', flat=True).iterator()
+            }
+            for entry in os.scandir(settings.UPLOADS_TEMP_DIR):
+                if entry.is_file() and entry.name not in known:
+                    os.remove(entry.path)
+                    deleted += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено незавершённых загрузок: {deleted}'
+        ))
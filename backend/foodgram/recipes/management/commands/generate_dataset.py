@@ -0,0 +1,283 @@
+import io
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from recipes.bulk import analyze, bulk_insert, next_pk, reset_sequences
+from recipes.catalog import bump_catalog_version
+from recipes.counters import refresh_counters
+from recipes.images import save_variants
+from recipes.models import (
+    Favorite,
+    Follow,
+    Ingredient,
+    Recipe,
+    RecipeIngredients,
+    ShoppingCart,
+    Tag,
+    User,
+)
+from recipes.storage import image_storage
+from recipes.versions import recipes_changed
+
+DISHES = (
+    'Борщ', 'Плов', 'Салат', 'Пирог', 'Суп', 'Омлет', 'Рагу',
+    'Запеканка', 'Каша', 'Котлеты', 'Блины', 'Паста',
+)
+STYLES = (
+    'домашний', 'быстрый', 'праздничный', 'постный', 'острый',
+    'бабушкин', 'летний', 'зимний', 'сытный', 'лёгкий',
+)
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+
+
+class ZipfSampler:
+
+    def __init__(self, size, skew):
+        self.population = range(size)
+        self.cum_weights = list(accumulate(
+            1 / (rank ** skew) for rank in range(1, size + 1)
+        ))
+
+    def sample(self, rng, count):
+        return set(rng.choices(
+            self.population, cum_weights=self.cum_weights, k=count
+        ))
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with a reproducible synthetic dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--follows-per-user', type=int, default=10)
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--cart-per-user', type=int, default=5)
+        parser.add_argument(
+            '--author-skew', type=float, default=1.1,
+            help='Zipf exponent of recipes and followers per author',
+        )
+        parser.add_argument(
+            '--recipe-skew', type=float, default=1.1,
+            help='Zipf exponent of favorites and carts per recipe',
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='Spread publication dates over this many days',
+        )
+        parser.add_argument('--password', default='dataset-password')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.now = timezone.now()
+        self.image_name, self.image_variants = self.ensure_image()
+        with transaction.atomic():
+            self.tag_ids = self.ensure_tags()
+            self.ingredient_ids = self.ensure_ingredients()
+            self.first_user = next_pk(User)
+            self.first_recipe = next_pk(Recipe)
+            self.insert(User, (
+                'id', 'password', 'is_superuser', 'username', 'first_name',
+                'last_name', 'email', 'is_staff', 'is_active', 'date_joined',
+                'recipes_count', 'followers_count', 'subscriptions_count',
+            ), self.users())
+            self.insert(Recipe, (
+                'id', 'name', 'author', 'image', 'image_variants', 'text',
+                'cooking_time', 'pub_date', 'updated_at', 'favorites_count',
+            ), self.recipes())
+            self.insert(
+                RecipeIngredients,
+                ('recipe', 'ingredient', 'amount'),
+                self.recipe_ingredients(),
+            )
+            self.insert(
+                Recipe.tags.through, ('recipe', 'tag'), self.recipe_tags()
+            )
+            self.insert(Follow, ('follower', 'author'), self.follows())
+            self.insert(
+                Favorite, ('user', 'recipe', 'created_at'), self.favorites()
+            )
+            self.insert(
+                ShoppingCart,
+                ('user', 'recipe'),
+                self.user_recipes('cart_per_user'),
+            )
+            reset_sequences(
+                User, Tag, Ingredient, Recipe, RecipeIngredients,
+                Recipe.tags.through, Follow, Favorite, ShoppingCart,
+            )
+            analyze(
+                User, Recipe, RecipeIngredients, Recipe.tags.through,
+                Follow, Favorite, ShoppingCart,
+            )
+            refresh_counters()
+            call_command('reconcile_shopping_aggregates', stdout=self.stdout)
+            call_command(
+                'refresh_popular_recipes', rebuild=True, stdout=self.stdout
+            )
+            # Вставки идут в обход сигналов, кеши сбрасываем сами.
+            recipes_changed(Recipe.objects.filter(
+                pk__gte=self.first_recipe
+            ).values('pk'))
+            transaction.on_commit(bump_catalog_version)
+        self.stdout.write(self.style.SUCCESS(
+            'Тестовые данные успешно сгенерированы'
+        ))
+
+    def rng(self, stream):
+        return random.Random(f'{self.options["seed"]}:{stream}')
+
+    def insert(self, model, fields, rows):
+        started = time.monotonic()
+        inserted = bulk_insert(
+            model, fields, rows, self.options['batch_size']
+        )
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(
+            f'{model._meta.db_table}: {inserted} строк '
+            f'за {elapsed:.1f} с ({inserted / elapsed:.0f} строк/с)'
+        )
+
+    def ensure_image(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 480), '#E26C2D').save(buffer, 'PNG')
+        name = image_storage.save(
+            'recipes/images/dataset.png', ContentFile(buffer.getvalue())
+        )
+        variants = Recipe.objects.filter(
+            image=name, image_variants__source=name
+        ).values_list('image_variants', flat=True).first()
+        return name, variants or save_variants(name)
+
+    def ensure_tags(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in TAGS
+            )
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def ensure_ingredients(self):
+        if not Ingredient.objects.exists():
+            Ingredient.objects.bulk_create(
+                Ingredient(name=f'продукт {index}', measurement_unit='г')
+                for index in range(1, 501)
+            )
+        return list(Ingredient.objects.values_list('id', flat=True))
+
+    def users(self):
+        password = make_password(self.options['password'])
+        for user_id in range(
+            self.first_user, self.first_user + self.options['users']
+        ):
+            yield (
+                user_id, password, False, f'user_{user_id}', 'Имя',
+                'Фамилия', f'user_{user_id}@example.com', False, True,
+                self.now, 0, 0, 0,
+            )
+
+    def recipes(self):
+        rng = self.rng('recipes')
+        authors = ZipfSampler(
+            self.options['users'], self.options['author_skew']
+        )
+        period = self.options['days'] * 24 * 60 * 60
+        for recipe_id in range(
+            self.first_recipe, self.first_recipe + self.options['recipes']
+        ):
+            (author,) = authors.sample(rng, 1)
+            pub_date = self.now - timedelta(seconds=rng.randint(0, period))
+            yield (
+                recipe_id,
+                f'{rng.choice(DISHES)} {rng.choice(STYLES)} №{recipe_id}',
+                self.first_user + author,
+                self.image_name,
+                self.image_variants,
+                'Описание рецепта',
+                rng.randint(1, 180),
+                pub_date,
+                pub_date,
+                0,
+            )
+
+    def recipe_ids(self):
+        return range(
+            self.first_recipe, self.first_recipe + self.options['recipes']
+        )
+
+    def recipe_ingredients(self):
+        rng = self.rng('recipe_ingredients')
+        mean = self.options['ingredients_per_recipe']
+        for recipe_id in self.recipe_ids():
+            count = min(
+                rng.randint(max(mean // 2, 1), max(mean * 3 // 2, 1)),
+                len(self.ingredient_ids),
+            )
+            for ingredient_id in rng.sample(self.ingredient_ids, count):
+                yield recipe_id, ingredient_id, rng.randint(1, 500)
+
+    def recipe_tags(self):
+        rng = self.rng('recipe_tags')
+        count = min(self.options['tags_per_recipe'], len(self.tag_ids))
+        for recipe_id in self.recipe_ids():
+            for tag_id in rng.sample(self.tag_ids, rng.randint(1, count)):
+                yield recipe_id, tag_id
+
+    def user_ids(self):
+        return range(
+            self.first_user, self.first_user + self.options['users']
+        )
+
+    def follows(self):
+        rng = self.rng('follows')
+        authors = ZipfSampler(
+            self.options['users'], self.options['author_skew']
+        )
+        mean = self.options['follows_per_user']
+        for follower_id in self.user_ids():
+            for author in sorted(
+                authors.sample(rng, rng.randint(0, mean * 2))
+            ):
+                author_id = self.first_user + author
+                if author_id != follower_id:
+                    yield follower_id, author_id
+
+    def user_recipes(self, option):
+        rng = self.rng(option)
+        recipes = ZipfSampler(
+            self.options['recipes'], self.options['recipe_skew']
+        )
+        mean = self.options[option]
+        for user_id in self.user_ids():
+            for recipe in sorted(
+                recipes.sample(rng, rng.randint(0, mean * 2))
+            ):
+                yield user_id, self.first_recipe + recipe
+
+    def favorites(self):
+        rng = self.rng('favorite_dates')
+        period = self.options['days'] * 24 * 60 * 60
+        for user_id, recipe_id in self.user_recipes('favorites_per_user'):
+            yield (
+                user_id,
+                recipe_id,
+                self.now - timedelta(seconds=rng.randint(0, period)),
+            )
@@ -0,0 +1,223 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.catalog import bump_catalog_version
+from recipes.models import Ingredient, Tag
+
+CATALOGS = {
+    'ingredients': (Ingredient, ('name', 'measurement_unit'), None),
+    'tags': (Tag, ('name', 'color', 'slug'), 'slug'),
+}
+FORMATS = {
+    '.json': 'json',
+    '.csv': 'csv',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+}
+READ_SIZE = 64 * 1024
+WHITESPACE = ' \t\n\r'
+
+
+def read_json(file):
+    """Читает элементы JSON-массива по одному, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer, position, eof = '', 0, False
+    expected = '['
+    while True:
+        while position < len(buffer) and buffer[position] in WHITESPACE:
+            position += 1
+        if position < len(buffer):
+            char = buffer[position]
+            if expected == '[':
+                if char != '[':
+                    raise ValueError('Ожидается JSON-массив')
+                position += 1
+                expected = 'first'
+                continue
+            if char == ']' and expected in ('first', ','):
+                return
+            if expected == ',':
+                if char != ',':
+                    raise ValueError(f'Ожидается запятая, получено {char!r}')
+                position += 1
+                expected = 'item'
+                continue
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # Число на границе блока может быть прочитано не целиком.
+                if end < len(buffer) or eof:
+                    yield item
+                    position = end
+                    expected = ','
+                    continue
+        elif eof:
+            raise ValueError('Неожиданный конец JSON-массива')
+        chunk = file.read(READ_SIZE)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def read_ndjson(file):
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_csv(file):
+    yield from csv.DictReader(file)
+
+
+READERS = {
+    'json': read_json,
+    'csv': read_csv,
+    'ndjson': read_ndjson,
+}
+
+
+class Command(BaseCommand):
+    help = ('Import ingredients or tags from a JSON, CSV or NDJSON file; '
+            'existing rows are kept or updated, so reruns are safe')
+
+    def add_arguments(self, parser):
+        parser.add_argument('catalog', choices=CATALOGS)
+        parser.add_argument(
+            'path', nargs='?',
+            help='Defaults to <IMPORT_FOLDER>/<catalog>.json',
+        )
+        parser.add_argument(
+            '--format', choices=READERS,
+            help='Detected from the file extension by default',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        catalog = options['catalog']
+        model, fields, key = CATALOGS[catalog]
+        path = options['path'] or os.path.join(
+            settings.IMPORT_FOLDER, f'{catalog}.json'
+        )
+        file_format = options['format'] or FORMATS.get(
+            os.path.splitext(path)[1].lower()
+        )
+        if file_format is None:
+            raise CommandError(
+                f'Не удалось определить формат файла {path}, '
+                f'укажите --format'
+            )
+        existing = model.objects.count()
+        started = time.monotonic()
+        processed = skipped = 0
+        with open(path, encoding='utf-8-sig', newline='') as file:
+            rows = READERS[file_format](file)
+            try:
+                while True:
+                    batch = list(islice(rows, options['batch_size']))
+                    if not batch:
+                        break
+                    objects = []
+                    for number, row in enumerate(batch, processed + 1):
+                        values = self.clean(row, fields)
+                        if values is None:
+                            skipped += 1
+                            self.stderr.write(
+                                f'Запись {number} пропущена: {row!r}'
+                            )
+                        else:
+                            objects.append(model(**values))
+                    self.save(model, fields, key, objects)
+                    processed += len(batch)
+                    elapsed = max(time.monotonic() - started, 1e-6)
+                    self.stdout.write(
+                        f'{processed} записей за {elapsed:.1f} с '
+                        f'({processed / elapsed:.0f} записей/с)'
+                    )
+            except ValueError as error:
+                raise CommandError(
+                    f'{path}: ошибка после записи {processed}: {error}'
+                )
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Импорт {catalog} завершён: обработано {processed}, '
+            f'добавлено {model.objects.count() - existing}, '
+            f'пропущено {skipped}'
+        ))
+
+    @staticmethod
+    def clean(row, fields):
+        if not isinstance(row, dict):
+            return None
+        values = {}
+        for field in fields:
+            value = row.get(field)
+            if not isinstance(value, str) or not value.strip():
+                return None
+            values[field] = value.strip()
+        return values
+
+    @staticmethod
+    @transaction.atomic
+    def save(model, fields, key, objects):
+        if key is not None:
+            objects = list({
+                getattr(obj, key): obj for obj in objects
+            }.values())
+            stored = model.objects.in_bulk(
+                [getattr(obj, key) for obj in objects], field_name=key
+            )
+            changed = []
+            for obj in objects:
+                current = stored.get(getattr(obj, key))
+                if current is not None and any(
+                    getattr(current, field) != getattr(obj, field)
+                    for field in fields
+                ):
+                    obj.pk = current.pk
+                    changed.append(obj)
+            objects = [
+                obj for obj in objects if getattr(obj, key) not in stored
+            ]
+            clashes = Command.find_clashes(
+                model, fields, key, [*changed, *objects]
+            )
+            if clashes:
+                raise CommandError(
+                    'Значения уже заняты другими записями:\n'
+                    + '\n'.join(clashes)
+                )
+            if changed:
+                model.objects.bulk_update(changed, fields)
+        model.objects.bulk_create(objects, ignore_conflicts=True)
+
+    @staticmethod
+    def find_clashes(model, fields, key, objects):
+        """Находит записи, чьи уникальные поля заняты записями с другим
+        ключом: bulk_update упал бы на них с IntegrityError, а bulk_create
+        молча пропустил бы."""
+        clashes = []
+        for field in fields:
+            if field == key or not model._meta.get_field(field).unique:
+                continue
+            owners = dict(model.objects.filter(**{
+                f'{field}__in': [getattr(obj, field) for obj in objects]
+            }).values_list(field, key))
+            for obj in objects:
+                value = getattr(obj, field)
+                owner = owners.setdefault(value, getattr(obj, key))
+                if owner != getattr(obj, key):
+                    clashes.append(
+                        f'{key}={getattr(obj, key)}: {field}={value!r} '
+                        f'занято записью {key}={owner}'
+                    )
+        return clashes
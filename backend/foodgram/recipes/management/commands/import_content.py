@@ -0,0 +1,286 @@
+import gzip
+import json
+import time
+from itertools import groupby
+from operator import itemgetter
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+
+from recipes.bulk import batches, bulk_insert, next_pk, reset_sequences
+from recipes.catalog import bump_catalog_version
+from recipes.constants import CONTENT_FORMAT_VERSION
+from recipes.counters import refresh_counters
+from recipes.models import (
+    Favorite,
+    Follow,
+    Ingredient,
+    Recipe,
+    RecipeIngredients,
+    ShoppingCart,
+    Tag,
+    User,
+)
+from recipes.versions import recipes_changed
+
+
+class Command(BaseCommand):
+    help = ('Import content exported by export_content; users are matched '
+            'by username or email, recipes always get new ids')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        with gzip.open(options['path'], 'rt', encoding='utf-8') as file:
+            records = (json.loads(line) for line in file if line.strip())
+            header = next(records, None)
+            if not header or header.get('model') != 'header' or (
+                header.get('format') != CONTENT_FORMAT_VERSION
+            ):
+                raise CommandError(
+                    f'{options["path"]}: неизвестный формат выгрузки'
+                )
+            with transaction.atomic():
+                if connection.vendor == 'postgresql':
+                    with connection.cursor() as cursor:
+                        cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+                self.prepare(header['first_ids'])
+                self.created_at = header['created_at']
+                for name, group in groupby(records, key=itemgetter('model')):
+                    handler = getattr(self, f'import_{name}', None)
+                    if handler is None:
+                        raise CommandError(f'Неизвестный тип записей: {name}')
+                    started = time.monotonic()
+                    imported = handler(group)
+                    elapsed = max(time.monotonic() - started, 1e-6)
+                    self.stdout.write(
+                        f'{name}: {imported} записей за {elapsed:.1f} с '
+                        f'({imported / elapsed:.0f} записей/с)'
+                    )
+                reset_sequences(
+                    User, Tag, Ingredient, Recipe, RecipeIngredients,
+                    Recipe.tags.through, Follow, Favorite, ShoppingCart,
+                )
+                refresh_counters()
+                call_command(
+                    'reconcile_shopping_aggregates', stdout=self.stdout
+                )
+                call_command(
+                    'refresh_popular_recipes', rebuild=True, stdout=self.stdout
+                )
+                recipes_changed(Recipe.objects.filter(
+                    pk__gte=self.first_recipe
+                ).values('pk'))
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS('Данные успешно загружены'))
+
+    def prepare(self, first_ids):
+        # Новые id получаем сдвигом исходных, поэтому таблица соответствия
+        # нужна только для совпавших пользователей и справочников.
+        self.user_offset = next_pk(User) - (first_ids['user'] or 0)
+        self.first_recipe = next_pk(Recipe)
+        self.recipe_offset = self.first_recipe - (first_ids['recipe'] or 0)
+        self.existing_users = {}
+        self.reused_users = set()
+        self.tags = {}
+        self.ingredients = {}
+
+    def user_id(self, source_id):
+        return self.existing_users.get(source_id, source_id + self.user_offset)
+
+    def recipe_id(self, source_id):
+        return source_id + self.recipe_offset
+
+    def import_user(self, records):
+        imported = 0
+        for batch in batches(records, self.batch_size):
+            by_username, by_email = {}, {}
+            for user_id, username, email in User.objects.filter(
+                Q(username__in=[record['username'] for record in batch])
+                | Q(email__in=[record['email'] for record in batch])
+            ).values_list('id', 'username', 'email'):
+                by_username[username] = by_email[email] = user_id
+            rows = []
+            for record in batch:
+                existing = by_username.get(record['username']) or (
+                    by_email.get(record['email'])
+                )
+                if existing is not None:
+                    self.existing_users[record['id']] = existing
+                    self.reused_users.add(existing)
+                    continue
+                rows.append((
+                    self.user_id(record['id']), record['password'], False,
+                    record['username'], record['first_name'],
+                    record['last_name'], record['email'], False,
+                    record['is_active'], record['date_joined'], 0, 0, 0,
+                ))
+            imported += bulk_insert(User, (
+                'id', 'password', 'is_superuser', 'username', 'first_name',
+                'last_name', 'email', 'is_staff', 'is_active', 'date_joined',
+                'recipes_count', 'followers_count', 'subscriptions_count',
+            ), rows)
+        return imported
+
+    def import_tag(self, records):
+        imported = 0
+        for batch in batches(records, self.batch_size):
+            by_slug, by_name, by_color = {}, {}, {}
+            for tag_id, slug, name, color in Tag.objects.filter(
+                Q(slug__in=[record['slug'] for record in batch])
+                | Q(name__in=[record['name'] for record in batch])
+                | Q(color__in=[record['color'] for record in batch])
+            ).values_list('id', 'slug', 'name', 'color'):
+                by_slug[slug], by_name[name], by_color[color] = (
+                    tag_id, tag_id, slug
+                )
+            # Тег с другим slug, но тем же названием считаем тем же тегом,
+            # а совпадение одного цвета разрешить нельзя: рецепты потеряли бы
+            # этот тег.
+            new, clashes = [], []
+            for record in batch:
+                tag_id = by_slug.get(record['slug']) or (
+                    by_name.get(record['name'])
+                )
+                if tag_id is not None:
+                    self.tags[record['slug']] = tag_id
+                elif record['color'] in by_color:
+                    clashes.append(
+                        f'{record["slug"]}: цвет {record["color"]} '
+                        f'уже у тега {by_color[record["color"]]}'
+                    )
+                else:
+                    new.append(Tag(
+                        name=record['name'],
+                        color=record['color'],
+                        slug=record['slug'],
+                    ))
+            if clashes:
+                raise CommandError(
+                    'Теги выгрузки конфликтуют с существующими:\n'
+                    + '\n'.join(clashes)
+                )
+            Tag.objects.bulk_create(new)
+            self.tags.update(Tag.objects.filter(
+                slug__in=[tag.slug for tag in new]
+            ).values_list('slug', 'id'))
+            imported += len(new)
+        return imported
+
+    def import_ingredient(self, records):
+        imported = 0
+        for batch in batches(records, self.batch_size):
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(
+                        name=record['name'],
+                        measurement_unit=record['measurement_unit'],
+                    )
+                    for record in batch
+                ),
+                ignore_conflicts=True,
+            )
+            stored = {
+                (name, unit): ingredient_id
+                for ingredient_id, name, unit in Ingredient.objects.filter(
+                    name__in={record['name'] for record in batch}
+                ).values_list('id', 'name', 'measurement_unit')
+            }
+            for record in batch:
+                self.ingredients[record['id']] = stored[
+                    record['name'], record['measurement_unit']
+                ]
+            imported += len(batch)
+        return imported
+
+    def import_recipe(self, records):
+        return bulk_insert(Recipe, (
+            'id', 'author', 'name', 'text', 'cooking_time', 'image',
+            'image_variants', 'pub_date', 'updated_at', 'favorites_count',
+        ), (
+            (
+                self.recipe_id(record['id']),
+                self.user_id(record['author']),
+                record['name'],
+                record['text'],
+                record['cooking_time'],
+                record['image'],
+                record['image_variants'],
+                record['pub_date'],
+                record['updated_at'],
+                0,
+            )
+            for record in records
+        ), self.batch_size)
+
+    def import_recipe_tag(self, records):
+        return bulk_insert(Recipe.tags.through, ('recipe', 'tag'), (
+            (self.recipe_id(record['recipe']), self.tags[record['tag']])
+            for record in records if record['tag'] in self.tags
+        ), self.batch_size)
+
+    def import_recipe_ingredient(self, records):
+        return bulk_insert(
+            RecipeIngredients,
+            ('recipe', 'ingredient', 'amount'),
+            (
+                (
+                    self.recipe_id(record['recipe']),
+                    self.ingredients[record['ingredient']],
+                    record['amount'],
+                )
+                for record in records
+            ),
+            self.batch_size,
+        )
+
+    def import_follow(self, records):
+        imported = 0
+        for batch in batches(records, self.batch_size):
+            rows = {
+                (self.user_id(record['follower']),
+                 self.user_id(record['author']))
+                for record in batch
+            }
+            # Подписки между уже существовавшими пользователями
+            # могли сохраниться в базе.
+            existing = [
+                (follower, author) for follower, author in rows
+                if follower in self.reused_users
+                and author in self.reused_users
+            ]
+            if existing:
+                rows -= set(Follow.objects.filter(
+                    follower__in={follower for follower, _ in existing},
+                    author__in={author for _, author in existing},
+                ).values_list('follower', 'author'))
+            imported += bulk_insert(Follow, ('follower', 'author'), (
+                (follower, author) for follower, author in rows
+                if follower != author
+            ))
+        return imported
+
+    def import_user_recipes(self, model, records):
+        return bulk_insert(model, ('user', 'recipe'), (
+            (self.user_id(record['user']), self.recipe_id(record['recipe']))
+            for record in records
+        ), self.batch_size)
+
+    def import_favorite(self, records):
+        # В ранних выгрузках времени добавления нет, берём время выгрузки.
+        return bulk_insert(Favorite, ('user', 'recipe', 'created_at'), (
+            (
+                self.user_id(record['user']),
+                self.recipe_id(record['recipe']),
+                record.get('created_at', self.created_at),
+            )
+            for record in records
+        ), self.batch_size)
+
+    def import_shopping_cart(self, records):
+        return self.import_user_recipes(ShoppingCart, records)
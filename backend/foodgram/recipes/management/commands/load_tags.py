@@ -1,24 +1,13 @@
-import json
-
-from django.conf import settings
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 
-from recipes.models import Tag
-
 
 class Command(BaseCommand):
     help = 'Import tags from tags.json'
 
     def handle(self, *args, **options):
-        file_path = f'{settings.IMPORT_FOLDER}/tags.json'
-
-        with open(file_path, 'r', encoding='utf-8') as file:
-            tags = json.load(file)
-
-            Tag.objects.bulk_create(
-                (Tag(**tag) for tag in tags),
-            )
-
-        self.stdout.write(self.style.SUCCESS(
-            'Теги успешно импортированы'
-        ))
+        call_command(
+            'import_catalog', 'tags',
+            stdout=self.stdout,
+            stderr=self.stderr,
+        )
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.bulk import batches
+from recipes.counters import count_related, get_counters
+
+
+class Command(BaseCommand):
+    help = 'Rebuild drifted counters of recipes, users and ingredients'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for model, counters in get_counters().items():
+            fixed = 0
+            for chunk in batches(
+                model.objects.order_by('pk').values_list(
+                    'pk', flat=True
+                ).iterator(),
+                options['batch_size'],
+            ):
+                with transaction.atomic():
+                    fixed += self.reconcile(model, counters, chunk)
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: '
+                f'исправлено счётчиков {fixed}'
+            )
+        self.stdout.write(self.style.SUCCESS('Счётчики сверены'))
+
+    @staticmethod
+    def reconcile(model, counters, pks):
+        fields = tuple(counters)
+        rows = model.objects.select_for_update().filter(
+            pk__in=pks
+        ).annotate(**{
+            f'expected_{field}': count_related(*related)
+            for field, related in counters.items()
+        }).values_list(
+            'pk', *fields, *(f'expected_{field}' for field in fields)
+        )
+        drifted = []
+        for pk, *values in rows:
+            current, expected = values[:len(fields)], values[len(fields):]
+            if current != expected:
+                drifted.append(model(pk=pk, **dict(zip(fields, expected))))
+        if drifted:
+            model.objects.bulk_update(drifted, fields)
+        return len(drifted)
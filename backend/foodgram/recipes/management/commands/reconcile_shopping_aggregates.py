@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.bulk import batches
+from recipes.models import (
+    RecipeIngredients,
+    ShoppingCart,
+    ShoppingListItem,
+)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild drifted shopping list aggregates from shopping carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        user_ids = ShoppingCart.objects.values_list(
+            'user_id', flat=True
+        ).union(
+            ShoppingListItem.objects.values_list('user_id', flat=True)
+        ).order_by('user_id')
+        created = updated = deleted = 0
+        for chunk in batches(
+            user_ids.iterator(), options['batch_size']
+        ):
+            with transaction.atomic():
+                stats = self.reconcile(chunk)
+            created += stats[0]
+            updated += stats[1]
+            deleted += stats[2]
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок сверены: создано {created}, '
+            f'исправлено {updated}, удалено {deleted}'
+        ))
+
+    def reconcile(self, user_ids):
+        expected = {
+            (row['recipe__shoppingcarts__user'], row['ingredient']):
+                row['total']
+            for row in RecipeIngredients.objects.filter(
+                recipe__shoppingcarts__user__in=user_ids
+            ).values(
+                'recipe__shoppingcarts__user', 'ingredient'
+            ).annotate(total=Sum('amount')).order_by()
+        }
+        stale = []
+        extra = []
+        for item in ShoppingListItem.objects.select_for_update().filter(
+            user_id__in=user_ids
+        ):
+            amount = expected.pop((item.user_id, item.ingredient_id), None)
+            if amount is None:
+                extra.append(item.id)
+            elif amount != item.amount:
+                item.amount = amount
+                stale.append(item)
+        ShoppingListItem.objects.filter(id__in=extra).delete()
+        ShoppingListItem.objects.bulk_update(stale, ('amount',))
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(
+                user_id=user, ingredient_id=ingredient, amount=amount
+            )
+            for (user, ingredient), amount in expected.items()
+        )
+        return len(expected), len(stale), len(extra)
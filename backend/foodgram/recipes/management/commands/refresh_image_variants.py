@@ -0,0 +1,134 @@
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import F, Q
+from django.db.models.fields.json import KeyTextTransform
+from django.utils import timezone
+
+from recipes.images import release_variants, save_variants, variant_names
+from recipes.models import Recipe
+from recipes.versions import recipes_changed
+
+
+def init_worker():
+    django.setup()
+
+
+def render(name):
+    try:
+        return name, save_variants(name), None
+    except Exception as error:
+        return name, None, f'{type(error).__name__}: {error}'
+
+
+class Command(BaseCommand):
+    help = 'Generate or refresh derived variants of recipe images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+        )
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument(
+            '--checkpoint',
+            default=os.path.join(
+                tempfile.gettempdir(), 'refresh_image_variants.json'
+            ),
+            help='File that stores the last processed image',
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Re-render images that already have variants',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Ignore the checkpoint and start from the beginning',
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        state = self.load_checkpoint()
+        started = time.monotonic()
+        processed = failed = 0
+        # Процессы наследуют соединения с БД при fork: закрываем их заранее,
+        # воркеры работают только с файлами.
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=options['workers'], initializer=init_worker
+        ) as executor:
+            while True:
+                names = self.next_batch(state['last'])
+                if not names:
+                    break
+                for name, variants, error in executor.map(render, names):
+                    if error is None:
+                        self.store(name, variants)
+                    else:
+                        failed += 1
+                        self.stderr.write(f'{name}: {error}')
+                processed += len(names)
+                state = {
+                    'last': names[-1],
+                    'processed': state['processed'] + len(names),
+                }
+                self.save_checkpoint(state)
+                elapsed = max(time.monotonic() - started, 1e-6)
+                self.stdout.write(
+                    f'{processed} изображений за {elapsed:.1f} с '
+                    f'({processed / elapsed:.1f} изобр./с), '
+                    f'ошибок: {failed}, последнее: {names[-1]}'
+                )
+        if os.path.exists(options['checkpoint']):
+            os.remove(options['checkpoint'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Варианты изображений обновлены: {processed - failed}, '
+            f'ошибок: {failed}'
+        ))
+
+    def next_batch(self, last):
+        recipes = Recipe.objects.exclude(image='').filter(image__gt=last)
+        if not self.options['force']:
+            recipes = recipes.annotate(
+                variants_source=KeyTextTransform('source', 'image_variants')
+            ).filter(
+                Q(variants_source__isnull=True)
+                | ~Q(variants_source=F('image'))
+            )
+        return list(recipes.order_by('image').values_list(
+            'image', flat=True
+        ).distinct()[:self.options['batch_size']])
+
+    def store(self, name, variants):
+        previous = Recipe.objects.filter(
+            image=name, image_variants__source=name
+        ).values_list('image_variants', flat=True).first() or {}
+        recipes = Recipe.objects.filter(image=name)
+        recipes.update(image_variants=variants, updated_at=timezone.now())
+        recipes_changed(recipes.values('pk'))
+        release_variants(
+            variant_names(previous) - variant_names(variants), name
+        )
+
+    def load_checkpoint(self):
+        path = self.options['checkpoint']
+        if self.options['restart'] or not os.path.exists(path):
+            return {'last': '', 'processed': 0}
+        with open(path, encoding='utf-8') as file:
+            state = json.load(file)
+        self.stdout.write(
+            f'Продолжаем с {state["last"]} '
+            f'(уже обработано {state["processed"]})'
+        )
+        return state
+
+    def save_checkpoint(self, state):
+        path = self.options['checkpoint']
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as file:
+            json.dump(state, file)
+        os.replace(f'{path}.tmp', path)
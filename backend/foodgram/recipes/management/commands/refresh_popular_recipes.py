@@ -0,0 +1,38 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from recipes.bulk import BATCH_SIZE
+from recipes.popularity import refresh_popularity
+
+
+class Command(BaseCommand):
+    help = ('Add favorites created since the previous run to the popular '
+            'recipes leaderboard and expire the ones that left its windows')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Drop the leaderboard and recompute it from all favorites',
+        )
+        parser.add_argument(
+            '--rebuild-hours', type=float, default=24,
+            help='Recompute the leaderboard from scratch when the last full '
+                 'recompute is older than this; 0 disables it',
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        added, expired, rebuilt = refresh_popularity(
+            options['rebuild'],
+            options['batch_size'],
+            timedelta(hours=options['rebuild_hours'])
+            if options['rebuild_hours'] else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Рейтинги {"пересчитаны" if rebuilt else "обновлены"} за '
+            f'{time.monotonic() - started:.1f} с: новых записей {added}, '
+            f'устаревших {expired}'
+        ))
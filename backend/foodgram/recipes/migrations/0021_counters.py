@@ -0,0 +1,61 @@
+# Generated by Django 3.2.16 on 2026-10-18 02:46
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+COUNTERS = (
+    ('Recipe', 'favorites_count', 'Favorite', 'recipe'),
+    ('User', 'recipes_count', 'Recipe', 'author'),
+    ('User', 'followers_count', 'Follow', 'author'),
+    ('User', 'subscriptions_count', 'Follow', 'follower'),
+    ('Ingredient', 'recipes_count', 'RecipeIngredients', 'ingredient'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model_name, field, related_name, related_field in COUNTERS:
+        related = apps.get_model('recipes', related_name).objects.filter(
+            **{related_field: models.OuterRef('pk')}
+        ).order_by().values(related_field).annotate(
+            count=models.Count('pk')
+        ).values('count')
+        apps.get_model('recipes', model_name).objects.update(
+            **{field: Coalesce(models.Subquery(related), 0)}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0020_recipe_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В рецептах'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписчики'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Рецепты'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='subscriptions_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписки'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
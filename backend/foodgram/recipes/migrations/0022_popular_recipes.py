@@ -0,0 +1,68 @@
+# Generated by Django 3.2.16 on 2026-10-18 02:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def fill_favorite_dates(apps, schema_editor):
+    # Время добавления старых записей неизвестно, поэтому берём дату
+    # публикации рецепта: иначе всё избранное попадёт в рейтинг недели.
+    Favorite = apps.get_model('recipes', 'Favorite')
+    Favorite.objects.update(created_at=models.Subquery(
+        apps.get_model('recipes', 'Recipe').objects.filter(
+            pk=models.OuterRef('recipe')
+        ).values('pub_date')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0021_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularityState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_favorite_id', models.BigIntegerField(default=0, verbose_name='Последняя учтённая запись избранного')),
+                ('refreshed_at', models.DateTimeField(null=True, verbose_name='Дата пересчёта')),
+            ],
+            options={
+                'verbose_name': 'состояние рейтингов',
+                'verbose_name_plural': 'Состояние рейтингов',
+            },
+        ),
+        migrations.AddField(
+            model_name='favorite',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_favorite_dates, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='PopularRecipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'За сутки'), ('week', 'За неделю'), ('all', 'За всё время')], max_length=10, verbose_name='Период')),
+                ('score', models.FloatField(default=0, verbose_name='Рейтинг')),
+                ('favorites_count', models.PositiveIntegerField(default=0, verbose_name='В избранном')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='popularity', to='recipes.recipe', verbose_name='Рецепт')),
+            ],
+            options={
+                'verbose_name': 'популярный рецепт',
+                'verbose_name_plural': 'Популярные рецепты',
+                'default_related_name': 'popularity',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='popularrecipe',
+            index=models.Index(fields=['period', '-score'], name='popular_period_score_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='popularrecipe',
+            constraint=models.UniqueConstraint(fields=('recipe', 'period'), name='unique_popular_recipe_period'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.16 on 2026-10-18 04:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0022_popular_recipes'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='popularitystate',
+            name='last_favorite_id',
+        ),
+        migrations.AddField(
+            model_name='popularitystate',
+            name='counted_until',
+            field=models.DateTimeField(null=True, verbose_name='Учтено избранное по'),
+        ),
+        migrations.AddField(
+            model_name='popularitystate',
+            name='rebuilt_at',
+            field=models.DateTimeField(null=True, verbose_name='Дата полного пересчёта'),
+        ),
+    ]
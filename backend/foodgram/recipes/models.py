@@ -1,19 +1,57 @@
-from django.contrib.auth.models import AbstractUser
+import os
+import uuid
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
+from django.db import connection, models
+from django.db.models import (
+    Case,
+    Exists,
+    F,
+    OuterRef,
+    Q,
+    Value,
+    When,
+    Window,
+)
+from django.db.models.functions import RowNumber
 
 from .constants import (
     MAX_LENGTH_CHAR,
     MAX_LENGHT_FIELD,
+    MAX_LENGTH_PERIOD,
     MAX_LENGTH_SLUG,
     MAX_LENGTH_STRING,
     MIN_TIME,
     MAX_COLOR_FIELD,
+    POPULAR_PERIODS,
 )
+from .counters import CountersModelMixin, change_counter
+from .storage import image_storage
 from .validators import validate_username
 
 
-class User(AbstractUser):
+class UserQuerySet(models.QuerySet):
+
+    def with_subscription(self, user):
+        if user.is_anonymous:
+            return self.annotate(is_subscribed=Value(
+                False, output_field=models.BooleanField()
+            ))
+        return self.annotate(is_subscribed=Exists(Follow.objects.filter(
+            author=OuterRef('pk'), follower=user
+        )))
+
+
+class UsersManager(UserManager.from_queryset(UserQuerySet)):
+    pass
+
+
+class User(CountersModelMixin, AbstractUser):
     first_name = models.CharField(
         'Имя',
         max_length=MAX_LENGHT_FIELD,
@@ -32,10 +70,27 @@ class User(AbstractUser):
         'Электронная почта',
         unique=True,
     )
+    recipes_count = models.PositiveIntegerField(
+        'Рецепты',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        'Подписчики',
+        default=0,
+        editable=False,
+    )
+    subscriptions_count = models.PositiveIntegerField(
+        'Подписки',
+        default=0,
+        editable=False,
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name',)
 
+    objects = UsersManager()
+
     class Meta:
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
@@ -105,7 +160,7 @@ class Tag(models.Model):
         return self.name[:MAX_LENGTH_STRING]
 
 
-class Ingredient(models.Model):
+class Ingredient(CountersModelMixin, models.Model):
     name = models.CharField(
         'Продукт',
         max_length=MAX_LENGHT_FIELD,
@@ -114,6 +169,11 @@ class Ingredient(models.Model):
         'Единица измерения',
         max_length=MAX_LENGTH_CHAR,
     )
+    recipes_count = models.PositiveIntegerField(
+        'В рецептах',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'продукт'
@@ -131,7 +191,70 @@ class Ingredient(models.Model):
         return f'{self.name[:MAX_LENGTH_STRING]} ({self.measurement_unit})'
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create не отправляет сигналы, счётчики меняем здесь.
+        objs = super().bulk_create(objs, *args, **kwargs)
+        change_counter(
+            User, 'recipes_count', (recipe.author_id for recipe in objs)
+        )
+        return objs
+
+    def with_user_flags(self, user):
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, output_field=models.BooleanField()),
+                is_in_shopping_cart=Value(
+                    False, output_field=models.BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+        )
+
+    def ranked_by_author(self, author_ids, limit):
+        ranked = self.filter(author__in=author_ids).only(
+            'id', 'name', 'image', 'image_variants', 'cooking_time', 'author',
+        ).annotate(author_position=Window(
+            expression=RowNumber(),
+            partition_by=F('author'),
+            order_by=(F('pub_date').desc(), F('id').desc()),
+        )).order_by()
+        sql, params = ranked.query.sql_with_params()
+        position = connection.ops.quote_name('author_position')
+        return self.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE {position} <= %s '
+            f'ORDER BY {position}',
+            (*params, limit),
+        )
+
+    def latest_by_author(self, author_ids, limit):
+        if not author_ids:
+            return {}
+        recipes = defaultdict(list)
+        for recipe in self.ranked_by_author(author_ids, limit):
+            recipes[recipe.author_id].append(recipe)
+        return recipes
+
+    def with_relations(self):
+        return self.select_related('author').prefetch_related(
+            'tags',
+            models.Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredients.objects.select_related(
+                    'ingredient'
+                ).order_by('ingredient__name'),
+            ),
+        )
+
+
+class Recipe(CountersModelMixin, models.Model):
     name = models.CharField(
         'Рецепт',
         max_length=MAX_LENGTH_CHAR,
@@ -144,6 +267,14 @@ class Recipe(models.Model):
     image = models.ImageField(
         'Изображение',
         upload_to='recipes/images/',
+        storage=image_storage,
+        db_index=True,
+    )
+    image_variants = models.JSONField(
+        'Варианты изображения',
+        default=dict,
+        blank=True,
+        editable=False,
     )
     text = models.TextField(
         'Текстовое описание',
@@ -173,17 +304,61 @@ class Recipe(models.Model):
         'Дата публикации',
         auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'рецепт'
         verbose_name_plural = 'Рецепты'
         default_related_name = 'recipes'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx',
+            ),
+        )
 
     def __str__(self):
         return self.name[:MAX_LENGTH_STRING]
 
 
+class RecipeIngredientsQuerySet(models.QuerySet):
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        change_counter(
+            Ingredient, 'recipes_count', (row.ingredient_id for row in objs)
+        )
+        return objs
+
+    def bulk_delete(self):
+        # Удаление без сигналов на каждую строку, как и bulk_create: рецепт
+        # отмечает изменённым сохранение самого рецепта.
+        ingredients = list(self.values_list('ingredient_id', flat=True))
+        deleted = self._raw_delete(self.db)
+        change_counter(Ingredient, 'recipes_count', ingredients, -1)
+        return deleted
+
+    def amounts(self, recipe_id):
+        return dict(self.filter(recipe_id=recipe_id).values_list(
+            'ingredient_id', 'amount'
+        ))
+
+
 class RecipeIngredients(models.Model):
     ingredient = models.ForeignKey(
         Ingredient,
@@ -199,6 +374,8 @@ class RecipeIngredients(models.Model):
         'Мера',
     )
 
+    objects = RecipeIngredientsQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Продукт в рецепте'
         verbose_name_plural = 'Продукты в рецептах'
@@ -244,6 +421,11 @@ class UserRelatedRecipe(models.Model):
 
 
 class Favorite(UserRelatedRecipe):
+    created_at = models.DateTimeField(
+        'Дата добавления',
+        auto_now_add=True,
+        db_index=True,
+    )
 
     class Meta(UserRelatedRecipe.Meta):
         verbose_name = 'рецепт в избранном'
@@ -255,3 +437,206 @@ class ShoppingCart(UserRelatedRecipe):
     class Meta(UserRelatedRecipe.Meta):
         verbose_name = 'рецепт в списке покупок'
         verbose_name_plural = 'Рецепты в списке покупок'
+
+
+class PopularRecipe(models.Model):
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+    )
+    period = models.CharField(
+        'Период',
+        max_length=MAX_LENGTH_PERIOD,
+        choices=POPULAR_PERIODS,
+    )
+    score = models.FloatField(
+        'Рейтинг',
+        default=0,
+    )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'популярный рецепт'
+        verbose_name_plural = 'Популярные рецепты'
+        default_related_name = 'popularity'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'period',),
+                name='unique_popular_recipe_period'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('period', '-score'),
+                name='popular_period_score_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe.name[:MAX_LENGTH_STRING]}: {self.period}'
+
+
+class PopularityState(models.Model):
+    counted_until = models.DateTimeField(
+        'Учтено избранное по',
+        null=True,
+    )
+    refreshed_at = models.DateTimeField(
+        'Дата пересчёта',
+        null=True,
+    )
+    rebuilt_at = models.DateTimeField(
+        'Дата полного пересчёта',
+        null=True,
+    )
+
+    class Meta:
+        verbose_name = 'состояние рейтингов'
+        verbose_name_plural = 'Состояние рейтингов'
+
+    def __str__(self):
+        return f'{self.counted_until} ({self.refreshed_at})'
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+
+    def change(self, user_ids, amounts):
+        user_ids = list(user_ids)
+        amounts = {
+            ingredient: amount
+            for ingredient, amount in amounts.items() if amount
+        }
+        if not (user_ids and amounts):
+            return
+        increments = [
+            ingredient for ingredient, amount in amounts.items() if amount > 0
+        ]
+        if increments:
+            self.bulk_create(
+                (
+                    self.model(
+                        user_id=user, ingredient_id=ingredient, amount=0
+                    )
+                    for user in user_ids for ingredient in increments
+                ),
+                ignore_conflicts=True,
+            )
+        decrements = [
+            Q(ingredient_id=ingredient, amount__lte=-amount)
+            for ingredient, amount in amounts.items() if amount < 0
+        ]
+        if decrements:
+            self.filter(user_id__in=user_ids).filter(
+                reduce(or_, decrements)
+            ).delete()
+        self.filter(
+            user_id__in=user_ids, ingredient_id__in=amounts
+        ).update(amount=F('amount') + Case(
+            *(
+                When(ingredient_id=ingredient, then=Value(amount))
+                for ingredient, amount in amounts.items()
+            ),
+            default=Value(0),
+            output_field=models.IntegerField(),
+        ))
+
+    def export_rows(self, user):
+        return self.filter(user=user).values(
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            total_amount=F('amount'),
+        ).order_by('ingredient__name')
+
+    def change_for_recipe(self, recipe, amounts):
+        self.change(
+            ShoppingCart.objects.filter(
+                recipe=recipe
+            ).values_list('user_id', flat=True),
+            amounts,
+        )
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Продукт',
+    )
+    amount = models.PositiveIntegerField(
+        'Количество',
+    )
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'продукт в списке покупок'
+        verbose_name_plural = 'Продукты в списке покупок'
+        default_related_name = 'shopping_list_items'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient',),
+                name='unique_shopping_list_item'
+            ),
+        )
+
+    def __str__(self):
+        return (
+            f'{self.user.username}: '
+            f'{self.ingredient.name[:MAX_LENGTH_STRING]} - {self.amount}'
+        )
+
+
+class ImageUpload(models.Model):
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False,
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+    )
+    size = models.PositiveIntegerField(
+        'Размер',
+    )
+    offset = models.PositiveIntegerField(
+        'Загружено байт',
+        default=0,
+    )
+    created_at = models.DateTimeField(
+        'Дата создания',
+        auto_now_add=True,
+    )
+
+    class Meta:
+        verbose_name = 'загрузка изображения'
+        verbose_name_plural = 'Загрузки изображений'
+        default_related_name = 'image_uploads'
+
+    def __str__(self):
+        return f'{self.id} ({self.offset}/{self.size})'
+
+    @property
+    def path(self):
+        return os.path.join(settings.UPLOADS_TEMP_DIR, self.id.hex)
+
+    @property
+    def is_complete(self):
+        return self.offset == self.size
+
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        self.delete()
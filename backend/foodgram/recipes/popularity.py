@@ -0,0 +1,150 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .bulk import BATCH_SIZE, batches
+
+# Окно рейтинга и период полураспада веса добавления в избранное;
+# рейтинг за всё время считает добавления без затухания.
+PERIODS = {
+    'day': (timedelta(days=1), timedelta(hours=6)),
+    'week': (timedelta(days=7), timedelta(days=2)),
+    'all': (None, None),
+}
+# Идентификатор избранного выдаётся при вставке, а видна запись после
+# коммита, поэтому новые записи отбираются по дате добавления с отставанием:
+# к этому моменту транзакции, добавившие их, уже закоммичены.
+COMMIT_LAG = timedelta(minutes=1)
+
+
+def weight(age, half_life):
+    if half_life is None:
+        return 1.0
+    return 0.5 ** (max(age, timedelta()) / half_life)
+
+
+def refresh_popularity(
+    rebuild=False, batch_size=BATCH_SIZE, rebuild_after=None
+):
+    """Добавляет в рейтинги новое избранное и вычитает вышедшее из окна.
+
+    Оценки хранятся на момент прошлого пересчёта и затухают общим
+    множителем, поэтому работа зависит от числа новых и устаревших
+    записей, а не от размера таблицы избранного. Раз в rebuild_after
+    рейтинги пересчитываются целиком, чтобы исправить накопленный дрейф.
+    """
+    from .models import Favorite, PopularityState, PopularRecipe
+
+    with transaction.atomic():
+        state, _ = PopularityState.objects.select_for_update().get_or_create(
+            pk=1
+        )
+        now = timezone.now()
+        outdated = rebuild_after is not None and (
+            state.rebuilt_at is None or state.rebuilt_at <= now - rebuild_after
+        )
+        # Без отметки учтённого избранного рейтинги не продолжить.
+        rebuild = rebuild or outdated or state.counted_until is None
+        if rebuild:
+            PopularRecipe.objects.all().delete()
+            state.counted_until, state.refreshed_at = None, None
+            state.rebuilt_at = now
+        counted_until = now - COMMIT_LAG
+        new = Favorite.objects.filter(created_at__lte=counted_until)
+        if not rebuild:
+            new = new.filter(created_at__gt=state.counted_until)
+        windowed = {
+            period: (window, half_life)
+            for period, (window, half_life) in PERIODS.items() if window
+        }
+        deltas = defaultdict(lambda: [0.0, 0])
+        for period, (window, _) in PERIODS.items():
+            if window is None:
+                for recipe, count in new.values('recipe').annotate(
+                    count=Count('pk')
+                ).order_by().values_list('recipe', 'count').iterator():
+                    deltas[period, recipe] = [float(count), count]
+        added = 0
+        for recipe, created_at in new.filter(
+            created_at__gt=now - max(window for window, _ in windowed.values())
+        ).values_list('recipe', 'created_at').iterator():
+            for period, (window, half_life) in windowed.items():
+                if created_at > now - window:
+                    delta = deltas[period, recipe]
+                    delta[0] += weight(now - created_at, half_life)
+                    delta[1] += 1
+            added += 1
+        expired = 0
+        if state.refreshed_at:
+            for period, (window, half_life) in windowed.items():
+                PopularRecipe.objects.filter(period=period).update(
+                    score=F('score') * weight(
+                        now - state.refreshed_at, half_life
+                    )
+                )
+                for recipe, created_at in Favorite.objects.filter(
+                    created_at__gt=state.refreshed_at - window,
+                    created_at__lte=min(state.counted_until, now - window),
+                ).values_list('recipe', 'created_at').iterator():
+                    delta = deltas[period, recipe]
+                    delta[0] -= weight(now - created_at, half_life)
+                    delta[1] -= 1
+                    expired += 1
+        for chunk in batches(deltas.items(), batch_size):
+            apply_deltas(chunk)
+        state.counted_until, state.refreshed_at = counted_until, now
+        state.save()
+    return added, expired, rebuild
+
+
+def apply_deltas(deltas):
+    from .models import PopularRecipe
+
+    rows = {
+        (row.period, row.recipe_id): row
+        for row in PopularRecipe.objects.select_for_update().filter(
+            recipe__in={recipe for (_, recipe), _ in deltas}
+        )
+    }
+    created, changed, empty = [], [], []
+    for (period, recipe), (score, count) in deltas:
+        row = rows.get((period, recipe)) or PopularRecipe(
+            recipe_id=recipe, period=period
+        )
+        row.score = max(row.score + score, 0.0)
+        row.favorites_count = max(row.favorites_count + count, 0)
+        if not row.favorites_count:
+            if row.pk:
+                empty.append(row.pk)
+        elif row.pk:
+            changed.append(row)
+        else:
+            created.append(row)
+    PopularRecipe.objects.filter(pk__in=empty).delete()
+    PopularRecipe.objects.bulk_update(changed, ('score', 'favorites_count'))
+    PopularRecipe.objects.bulk_create(created)
+
+
+def forget_favorite(favorite):
+    """Вычитает удалённое избранное, если пересчёт его уже учёл."""
+    from .models import PopularityState, PopularRecipe
+
+    state = PopularityState.objects.values_list(
+        'counted_until', 'refreshed_at'
+    ).first()
+    if state is None or state[0] is None or favorite.created_at > state[0]:
+        return
+    age = state[1] - favorite.created_at
+    rows = PopularRecipe.objects.filter(recipe=favorite.recipe_id)
+    for period, (window, half_life) in PERIODS.items():
+        if window and age >= window:
+            continue
+        rows.filter(period=period).update(
+            score=Greatest(F('score') - weight(age, half_life), 0.0),
+            favorites_count=Greatest(F('favorites_count') - 1, 0),
+        )
+    rows.filter(favorites_count=0).delete()
@@ -0,0 +1,183 @@
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .catalog import bump_catalog_version
+from .counters import change_counter
+from .images import release_image, schedule_variants
+from .models import (
+    Favorite,
+    Follow,
+    Ingredient,
+    Recipe,
+    RecipeIngredients,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+    User,
+)
+from .popularity import forget_favorite
+from .versions import author_changed, recipes_changed
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def catalog_changed(**kwargs):
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_saving(instance, **kwargs):
+    previous = instance.pk and Recipe.objects.filter(
+        pk=instance.pk
+    ).values_list('image', 'image_variants', 'author_id').first()
+    instance.previous_image = previous and previous[:2]
+    instance.previous_author = previous and previous[2]
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(instance, created, **kwargs):
+    if created:
+        change_counter(User, 'recipes_count', (instance.author_id,))
+    elif instance.previous_author and (
+        instance.previous_author != instance.author_id
+    ):
+        change_counter(User, 'recipes_count', (instance.previous_author,), -1)
+        change_counter(User, 'recipes_count', (instance.author_id,))
+    recipes_changed((instance.pk,))
+    previous = instance.previous_image
+    if previous and previous[0] != instance.image.name:
+        transaction.on_commit(lambda: release_image(*previous))
+    if instance.image and (
+        instance.image_variants.get('source') != instance.image.name
+    ):
+        schedule_variants(instance)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(instance, **kwargs):
+    recipes_changed((instance.pk,))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    change_counter(User, 'recipes_count', (instance.author_id,), -1)
+    name, variants = instance.image.name, instance.image_variants
+    transaction.on_commit(lambda: release_image(name, variants))
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredients)
+def recipe_ingredients_changed(instance, **kwargs):
+    Recipe.objects.filter(pk=instance.recipe_id).update(
+        updated_at=timezone.now()
+    )
+    recipes_changed((instance.recipe_id,))
+
+
+@receiver(pre_save, sender=RecipeIngredients)
+def recipe_ingredient_saving(instance, **kwargs):
+    instance.previous_ingredient = instance.pk and (
+        RecipeIngredients.objects.filter(pk=instance.pk).values_list(
+            'ingredient_id', flat=True
+        ).first()
+    )
+
+
+@receiver(post_save, sender=RecipeIngredients)
+def recipe_ingredient_saved(instance, created, **kwargs):
+    if created:
+        change_counter(Ingredient, 'recipes_count', (instance.ingredient_id,))
+    elif instance.previous_ingredient and (
+        instance.previous_ingredient != instance.ingredient_id
+    ):
+        change_counter(
+            Ingredient, 'recipes_count', (instance.previous_ingredient,), -1
+        )
+        change_counter(Ingredient, 'recipes_count', (instance.ingredient_id,))
+
+
+@receiver(post_delete, sender=RecipeIngredients)
+def recipe_ingredient_deleted(instance, **kwargs):
+    change_counter(
+        Ingredient, 'recipes_count', (instance.ingredient_id,), -1
+    )
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_saved(instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, 'favorites_count', (instance.recipe_id,))
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(instance, **kwargs):
+    change_counter(Recipe, 'favorites_count', (instance.recipe_id,), -1)
+    forget_favorite(instance)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_saved(instance, created, **kwargs):
+    if created:
+        ShoppingListItem.objects.change(
+            (instance.user_id,),
+            RecipeIngredients.objects.amounts(instance.recipe_id),
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def shopping_cart_deleting(instance, **kwargs):
+    # Срабатывает и при удалении через QuerySet, и каскадом от рецепта
+    # или пользователя, пока продукты рецепта ещё не удалены.
+    ShoppingListItem.objects.change(
+        (instance.user_id,),
+        {
+            ingredient: -amount
+            for ingredient, amount in RecipeIngredients.objects.amounts(
+                instance.recipe_id
+            ).items()
+        },
+    )
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(instance, created, **kwargs):
+    if created:
+        change_counter(User, 'followers_count', (instance.author_id,))
+        change_counter(User, 'subscriptions_count', (instance.follower_id,))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(instance, **kwargs):
+    change_counter(User, 'followers_count', (instance.author_id,), -1)
+    change_counter(User, 'subscriptions_count', (instance.follower_id,), -1)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        recipes = Recipe.objects.filter(pk=instance.pk)
+    elif action == 'pre_clear':
+        recipes = instance.recipes.all()
+    else:
+        recipes = Recipe.objects.filter(pk__in=pk_set)
+    recipes.update(updated_at=timezone.now())
+    recipes_changed(
+        recipes.values('pk'),
+        tag_ids=(instance.pk,) if reverse else pk_set or (),
+    )
+
+
+@receiver(post_save, sender=User)
+def user_saved(instance, created, update_fields, **kwargs):
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    author_changed(instance.pk)
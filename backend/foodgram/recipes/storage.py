@@ -0,0 +1,47 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import connection, transaction
+from django.utils.deconstruct import deconstructible
+
+
+def lock_file(name):
+    """Блокирует имя файла до конца транзакции: файл, уже найденный
+    при сохранении, не удалят, пока ссылку на него не закоммитят.
+    Вне транзакции блокировка снимается сразу, поэтому вызывающий код
+    держит её в transaction.atomic() до записи ссылки."""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_advisory_xact_lock(hashtext(%s))', (name,)
+            )
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Называет файлы по sha256 содержимого: одинаковые файлы хранятся
+    один раз, а их адреса никогда не меняют содержимое."""
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory, filename = os.path.split(name)
+        name = os.path.join(
+            directory,
+            digest[:2],
+            digest + os.path.splitext(filename)[1].lower(),
+        )
+        with transaction.atomic():
+            lock_file(name)
+            if self.exists(name):
+                return name
+            return super().save(name, content, max_length)
+
+
+image_storage = ContentAddressedStorage()
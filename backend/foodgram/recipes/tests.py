@@ -0,0 +1,117 @@
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from .models import Favorite, Follow, Ingredient, PopularRecipe, Recipe, User
+from .popularity import COMMIT_LAG, refresh_popularity
+
+
+class CountersSaveTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Рецептов', password='password',
+        )
+        cls.reader = User.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='Читатель', last_name='Рецептов', password='password',
+        )
+        cls.ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Суп', text='Сварить', cooking_time=10,
+            image='recipes/images/soup.png',
+        )
+
+    def test_save_keeps_counters_changed_after_load(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        author = User.objects.get(pk=self.author.pk)
+        ingredient = Ingredient.objects.get(pk=self.ingredient.pk)
+        Favorite.objects.create(user=self.reader, recipe=self.recipe)
+        Follow.objects.create(follower=self.reader, author=self.author)
+        self.recipe.recipe_ingredients.create(
+            ingredient=self.ingredient, amount=5
+        )
+
+        recipe.name = 'Борщ'
+        recipe.save()
+        author.set_password('new-password')
+        author.save()
+        ingredient.measurement_unit = 'кг'
+        ingredient.save()
+
+        recipe.refresh_from_db()
+        author.refresh_from_db()
+        ingredient.refresh_from_db()
+        self.assertEqual(recipe.name, 'Борщ')
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertTrue(author.check_password('new-password'))
+        self.assertEqual(author.recipes_count, 1)
+        self.assertEqual(author.followers_count, 1)
+        self.assertEqual(ingredient.measurement_unit, 'кг')
+        self.assertEqual(ingredient.recipes_count, 1)
+
+    def test_bulk_delete_keeps_ingredient_counters(self):
+        self.recipe.recipe_ingredients.create(
+            ingredient=self.ingredient, amount=5
+        )
+        updated_at = Recipe.objects.get(pk=self.recipe.pk).updated_at
+
+        with self.assertNumQueries(3):
+            self.recipe.recipe_ingredients.all().bulk_delete()
+
+        self.ingredient.refresh_from_db()
+        self.assertEqual(self.ingredient.recipes_count, 0)
+        self.assertFalse(self.recipe.recipe_ingredients.exists())
+        self.assertEqual(
+            Recipe.objects.get(pk=self.recipe.pk).updated_at, updated_at
+        )
+
+
+class PopularityRefreshTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Рецептов', password='password',
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Суп', text='Сварить', cooking_time=10,
+            image='recipes/images/soup.png',
+        )
+
+    def add_favorite(self, age):
+        number = Favorite.objects.count()
+        user = User.objects.create_user(
+            email=f'reader{number}@example.com', username=f'reader{number}',
+            first_name='Читатель', last_name='Рецептов', password='password',
+        )
+        favorite = Favorite.objects.create(user=user, recipe=self.recipe)
+        Favorite.objects.filter(pk=favorite.pk).update(
+            created_at=timezone.now() - age
+        )
+
+    def test_late_commit_is_counted_by_next_refresh(self):
+        self.add_favorite(COMMIT_LAG * 2)
+        refresh_popularity()
+        # Запись, закоммиченная после пересчёта, но добавленная до него.
+        self.add_favorite(COMMIT_LAG / 2)
+        self.assertEqual(
+            PopularRecipe.objects.get(period='all').favorites_count, 1
+        )
+        refresh_popularity()
+        self.assertEqual(
+            PopularRecipe.objects.get(period='all').favorites_count, 1
+        )
+
+        later = timezone.now() + COMMIT_LAG
+        with mock.patch('recipes.popularity.timezone.now', return_value=later):
+            refresh_popularity()
+        self.assertEqual(
+            PopularRecipe.objects.get(period='all').favorites_count, 2
+        )
@@ -0,0 +1,90 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+RECIPES_VERSION_KEY = 'recipes:version:{}'
+RECIPES_CHANGED_KEY = 'recipes:changed:{}'
+GLOBAL = 'global'
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def tag_scope(slug):
+    return f'tag:{slug}'
+
+
+def get_or_add(keys, default):
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            cache.add(key, default(), timeout=None)
+            values[key] = cache.get(key)
+    return tuple(values[key] for key in keys)
+
+
+def get_versions(scopes):
+    return get_or_add(
+        [RECIPES_VERSION_KEY.format(scope) for scope in scopes],
+        time.time_ns,
+    )
+
+
+def get_changed_at(scopes):
+    """Время последнего сброса областей в секундах, учитывает удаления."""
+    return max(get_or_add(
+        [RECIPES_CHANGED_KEY.format(scope) for scope in scopes],
+        lambda: int(time.time()),
+    ))
+
+
+def bump_versions(scopes):
+    cache.set_many({
+        RECIPES_CHANGED_KEY.format(scope): int(time.time())
+        for scope in scopes
+    }, timeout=None)
+    for scope in scopes:
+        key = RECIPES_VERSION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def recipes_changed(recipe_ids, tag_ids=()):
+    """Сбрасывает кеш списков, где могут быть эти рецепты.
+
+    Авторов и теги собираем сразу: после коммита связи могут
+    уже исчезнуть, а сброс делаем после коммита, чтобы кеш не успел
+    заполниться старыми данными.
+    """
+    from .models import Recipe, Tag
+
+    scopes = {GLOBAL}
+    scopes.update(
+        author_scope(author_id) for author_id in Recipe.objects.filter(
+            pk__in=recipe_ids
+        ).values_list('author_id', flat=True)
+    )
+    scopes.update(
+        tag_scope(slug) for slug in Tag.objects.filter(
+            Q(pk__in=tag_ids) | Q(recipes__in=recipe_ids)
+        ).values_list('slug', flat=True).order_by().distinct()
+    )
+    transaction.on_commit(lambda: bump_versions(scopes))
+
+
+def author_changed(author_id):
+    """Сбрасывает списки с рецептами автора, в том числе по тегам."""
+    from .models import Tag
+
+    scopes = {GLOBAL, author_scope(author_id)}
+    scopes.update(
+        tag_scope(slug) for slug in Tag.objects.filter(
+            recipes__author=author_id
+        ).values_list('slug', flat=True).order_by().distinct()
+    )
+    transaction.on_commit(lambda: bump_versions(scopes))